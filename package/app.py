@@ -1,8 +1,22 @@
 from chalice import Chalice
-from chalicelib import awsAuditor
+from chalicelib import awsAuditor, runtime
 
 app = Chalice(app_name='package')
 
 @app.lambda_function()
 def lambda_handler(event, context):
-    awsAuditor.main()
+    # Warm invocations reuse runtime.context. An event of {"invalidate": true}, {"invalidate": "credentials"} or
+    # {"invalidate": ["accounts", "credentials"]} reloads everything, or just the kinds named, before the run.
+    invalidate = event.get('invalidate') if isinstance(event, dict) else None
+    if invalidate:
+        if invalidate is True:
+            invalidate = []
+        elif isinstance(invalidate, str):
+            invalidate = [invalidate]
+        runtime.context.invalidate(*invalidate)
+
+    try:
+        awsAuditor.main()
+    except Exception:
+        runtime.context.invalidate()  # Don't let a stale credential or account list break the next run too.
+        raise
@@ -1,14 +1,31 @@
+import argparse
+import calendar
 import datetime
-import boto3
 import json
+from chalicelib import clients, runtime
+from chalicelib.costExporter import CostExporter
+from chalicelib.profiler import get_profiler
+from chalicelib.replay import Outbox
 from chalicelib.reportGenerator import ReportGenerator
+from chalicelib.responseCache import ResponseCache
 
 """
 Send month-to-date account management reports and individualized reports to specified individuals.
+
+Reports for other periods or recipients can be made from within the package directory, eg:
+
+    python -m chalicelib.awsAuditor --month 2019-01 --month 2019-02 --user user1 --output /tmp/outbox
 """
 
+config_bucket = 'bucketwith-config'
+config_path = 'config.json'
+
+# The settings a "render_policy" dictionary in config.json may hold. Each is a keyword argument of ReportGenerator,
+# except top_movers, which is its movers_count.
+render_policy_keys = ('min_series_total', 'sparkline_below', 'top_movers', 'layout', 'render_workers')
+
 
-def get_config(bucket, path):
+def get_config(bucket, path, client_factory=clients.registry):
     """
     Determine the config settings.
 
@@ -20,40 +37,212 @@ def get_config(bucket, path):
 
     :param str bucket: the name of the bucket where the recipient info is stored.
     :param str path: The path to the file in 'bucket'.
+    :param client_factory: A callable with the signature of boto3.client used to create the S3 client.
     :return dict: The dictionary that associates managers and the accounts they want reports for, the list of
                         users to receive individual reports and the secret name being used to configure the email.
     """
-    s3 = boto3.client('s3')
+    return runtime.RuntimeContext(client_factory).config(bucket, path)
+
+
+def month_period(month):
+    """
+    :param str month: A month in the format YYYY-MM.
+    :return tuple(str): The first and last dates of the month, in the format YYYY-MM-DD. The last date is today if
+                        the month is not over yet.
+    """
+    first = datetime.datetime.strptime(month, '%Y-%m').date()
+    last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    return str(first), str(min(last, datetime.date.today()))
 
-    file = s3.get_object(Bucket=bucket, Key=path)
-    j = json.loads(file['Body'].read())
 
-    return j
+def render_policy(config):
+    """
+    Collect how reports are rendered from the config.
 
+    The "render_policy" dictionary may set any of render_policy_keys. The top level keys chart_layout, top_movers and
+    render_workers, which the command line can override, take precedence over the layout, top_movers and
+    render_workers in it.
 
-def main():
-    start = str(datetime.date.today().replace(day=1))
-    end = str(datetime.date.today())
+    :raises ValueError: When render_policy has a key that is not in render_policy_keys.
+    :param dict config: The parsed config.json.
+    :return dict: Keyword arguments for ReportGenerator.
+    """
+    policy = dict(config.get('render_policy', dict()))
+    unknown = set(policy) - set(render_policy_keys)
+    if unknown:
+        raise ValueError('Unknown render policy settings: {}'.format(', '.join(sorted(unknown))))
 
-    bucket_name = 'bucketwith-config'
-    file_name = 'config.json'
+    for key, config_key in [('layout', 'chart_layout'), ('top_movers', 'top_movers'),
+                            ('render_workers', 'render_workers')]:
+        if config_key in config:
+            policy[key] = config[config_key]
 
-    config = get_config(bucket_name, file_name)
+    if 'top_movers' in policy:
+        policy['movers_count'] = policy.pop('top_movers')
+    return policy
 
-    manager_accounts = config['managers']
-    users = config['users']
-    secret_name = config['secret_name']
 
-    r = ReportGenerator(start_date=start, end_date=end, secret_name=secret_name)
+def group_managers(manager_accounts):
+    """
+    Group managers who receive reports for exactly the same accounts.
+
+    :param dict manager_accounts: The managers' email addresses and the list of account aliases each is sent reports for.
+    :return dict: Tuples of account aliases, in the order first given, mapped to the list of managers receiving them.
+    """
+    groups = dict()
+    seen = dict()  # frozenset of accounts -> the tuple used as the key of groups
 
-    # Send account management reports
     for manager, accounts in manager_accounts.items():
-        r.send_management_report([manager], accounts)
+        key = seen.setdefault(frozenset(accounts), tuple(accounts))
+        groups.setdefault(key, []).append(manager)
+
+    return groups
+
+
+def main(start=None, end=None, client_factory=None, smtp_factory=None, context=None, config=None, periods=None,
+         managers=None, users=None, profiler=None, outbox=None):
+    """
+    Send every management and individual report listed in the config.
+
+    When reports are made for several periods, each Cost Explorer query is made once for the range spanning all of
+    them, and the report for each period is made from its slice of the response.
+
+    :param str start: The first date of the reports, in the format YYYY-MM-DD. Defaults to the 1st of this month.
+    :param str end: The last date of the reports, in the format YYYY-MM-DD. Defaults to today.
+    :param client_factory: A callable with the signature of boto3.client used to create every AWS client.
+    :param smtp_factory: A callable with the signature of smtplib.SMTP used to connect to the mail server.
+    :param chalicelib.runtime.RuntimeContext context: The state kept between runs. Defaults to the module level
+                                                      chalicelib.runtime.context, unless client_factory is given, in
+                                                      which case nothing is kept.
+    :param dict config: The config to use instead of config.json in S3.
+    :param list(tuple) periods: (start, end) pairs of dates to send reports for, instead of start and end.
+    :param list(str) managers: Only send management reports to these managers. Defaults to every manager.
+    :param list(str) users: Only send individual reports to these users. Defaults to every user.
+    :param profiler: An object with the interface of chalicelib.profiler.Profiler to time the run with. Defaults to
+                     the one asked for by the environment or config, see chalicelib.profiler.get_profiler.
+    :param chalicelib.replay.Outbox outbox: Write the reports to this outbox instead of sending them. The config then
+                                            needs no secret_name, and no email credentials are looked up.
+    """
+    start = start or str(datetime.date.today().replace(day=1))
+    end = end or str(datetime.date.today())
+    periods = periods or [(start, end)]
+    if context is None:
+        context = runtime.RuntimeContext(client_factory) if client_factory else runtime.context
+    client_factory = context.client_factory
+
+    if config is None:
+        config = context.config(config_bucket, config_path)  # Only downloaded again if it changed since the last run.
+
+    # Tune the shared clients before any but the config's S3 client is made. Clients of a caller's own factory are
+    # left alone, so a test or replay never changes the settings of later runs. This only discards warm clients if
+    # the settings changed since the last invocation.
+    if client_factory is clients.registry:
+        clients.registry.configure(**config.get('client_config', dict()))
+
+    manager_accounts = {manager: accounts for manager, accounts in config['managers'].items()
+                        if managers is None or manager in managers}
+    users = [user for user in config['users'] if users is None or user in users]
+    secret_name = None if outbox else config['secret_name']
+    if outbox:
+        smtp_factory = outbox.smtp_factory
+    policy = render_policy(config)  # Checked before any report is made, so a misspelled setting fails fast.
+
+    profiler = profiler or get_profiler(config, client_factory)
+
+    first, last = min(start for start, _ in periods), max(end for _, end in periods)
+    response_cache = ResponseCache(first, last) if len(periods) > 1 else None
+
+    exporter = None
+    try:
+        if config.get('export'):
+            exporter = CostExporter(config['export'], 'costs-%s-%s' % (first, last),
+                                    config.get('export_formats', CostExporter.formats), client_factory)
+
+        for start, end in periods:
+            r = ReportGenerator(start_date=start, end_date=end, secret_name=secret_name,
+                                client_factory=client_factory, smtp_factory=smtp_factory, profiler=profiler,
+                                owner_rules=config.get('owner_rules'), runtime=context, response_cache=response_cache,
+                                exporter=exporter, sender=outbox.sender if outbox else None, **policy)
+
+            # Send account management reports. Managers of the same accounts get the same report, so send it once.
+            for accounts, group in group_managers(manager_accounts).items():
+                r.send_management_report(group, list(accounts))
+
+            # Send individual reports
+            for user in users:
+                r.send_individual_report(user)
+
+        if exporter:
+            with profiler.stage('export'):
+                exporter.close()
+    finally:
+        if exporter:
+            exporter.abort()  # Only does anything if the run failed before the export was closed.
+        profiler.save()  # Keep whatever was profiled, even if the run failed part way through.
+
+
+def parse_args(args=None):
+    """
+    :param list(str) args: The command line arguments. Defaults to sys.argv.
+    :return argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Send awsAuditor reports for any period, to any of the recipients '
+                                                 'in the config.')
+    parser.add_argument('--start', help='the first date of the reports, YYYY-MM-DD (default: the 1st of this month)')
+    parser.add_argument('--end', help='the last date of the reports, YYYY-MM-DD (default: today)')
+    parser.add_argument('--month', action='append', default=[], metavar='YYYY-MM',
+                        help='send reports for this month; may be repeated to backfill several months')
+    parser.add_argument('--period', action='append', default=[], nargs=2, metavar=('START', 'END'),
+                        help='send reports for this period; may be repeated')
+    parser.add_argument('--manager', action='append', metavar='EMAIL',
+                        help='only send the management report of this manager; may be repeated')
+    parser.add_argument('--user', action='append',
+                        help='only send the individual report of this user; may be repeated')
+    parser.add_argument('--workers', type=int, help='the number of processes to draw graphs in')
+    parser.add_argument('--layout', choices=ReportGenerator.layouts, help='how to lay out the graphs')
+    parser.add_argument('--config', help='a local config file to use instead of config.json in S3')
+    parser.add_argument('--export', metavar='DESTINATION',
+                        help='export the costs behind the reports to this directory or s3://bucket/prefix')
+    parser.add_argument('--output', metavar='DIRECTORY',
+                        help='write each report to this directory as a .eml file instead of emailing it')
+    return parser.parse_args(args)
+
+
+def run(args, client_factory=None):
+    """
+    Send the reports asked for on the command line.
+
+    When --manager or --user is given, only the recipients named are sent reports. With --output, no email
+    credentials are needed.
+
+    :param argparse.Namespace args: The arguments returned by parse_args.
+    :param client_factory: A callable with the signature of boto3.client used to create every AWS client. Defaults
+                           to the shared chalicelib.clients.registry.
+    :return chalicelib.replay.Outbox: The outbox the reports were written to, if --output was given.
+    """
+    context = runtime.RuntimeContext(client_factory) if client_factory else runtime.context
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    else:
+        config = context.config(config_bucket, config_path)
+
+    overrides = {'render_workers': args.workers, 'chart_layout': args.layout, 'export': args.export}
+    config = dict(config, **{key: value for key, value in overrides.items() if value is not None})
+
+    periods = [month_period(month) for month in args.month] + [tuple(period) for period in args.period]
+    if args.start or args.end or not periods:
+        today = datetime.date.today()
+        periods.append((args.start or str(today.replace(day=1)), args.end or str(today)))
+
+    managers = users = None
+    if args.manager or args.user:
+        managers, users = args.manager or [], args.user or []
 
-    # Send individual reports
-    for user in users:
-        r.send_individual_report(user)
+    outbox = Outbox(args.output) if args.output else None
+    main(context=context, config=config, periods=periods, managers=managers, users=users, outbox=outbox)
+    return outbox
 
 
 if __name__ == '__main__':
-    main()
+    run(parse_args())
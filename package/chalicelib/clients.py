@@ -0,0 +1,104 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+"""
+A shared registry of boto3 clients.
+
+Every AWS client used by awsauditor comes from the module level `registry`, which creates each client once from a
+single boto3 session with a tuned botocore Config and then hands the same client out again. Because the registry is
+module level it survives between warm invocations of the lambda, so connections are reused across runs too.
+"""
+
+
+class ClientRegistry:
+    """
+    Create and cache boto3 clients sharing one session, connection pool size, retry policy and timeouts.
+
+    A ClientRegistry can be used anywhere a client_factory is accepted, as it is called like boto3.client.
+    """
+
+    defaults = {
+        'max_pool_connections': 50,  # botocore's default of 10 is too few for concurrent Cost Explorer requests.
+        'retry_mode': 'adaptive',    # Backs off client side when Cost Explorer starts throttling.
+        'max_attempts': 10,
+        'connect_timeout': 10,
+        'read_timeout': 60,
+    }
+
+    def __init__(self, **settings):
+        """
+        :param settings: Overrides for any of the keys in ClientRegistry.defaults.
+        """
+        self.settings = dict(self.defaults)
+        self.settings.update(self._validate(settings))
+        self.session = None
+        self.clients = dict()
+        self.lock = threading.Lock()  # boto3 sessions are not thread safe, but the clients they create are.
+
+    def __call__(self, service_name, region_name=None, **kwargs):
+        """
+        Get the client for a service, creating it the first time it is asked for.
+
+        :param str service_name: The name of the AWS service, eg: 'ce'.
+        :param str region_name: The region the client should connect to.
+        :param kwargs: Any other arguments accepted by boto3.client.
+        :return: The boto3 client.
+        """
+        key = (service_name, region_name, tuple(sorted(kwargs.items())))
+        client = self.clients.get(key)
+
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    if self.session is None:
+                        self.session = boto3.session.Session()
+                    client = self.session.client(service_name, region_name=region_name, config=self.config(),
+                                                 **kwargs)
+                    self.clients[key] = client
+
+        return client
+
+    def config(self):
+        """
+        :return botocore.config.Config: The configuration every client is created with.
+        """
+        return Config(max_pool_connections=self.settings['max_pool_connections'],
+                      retries={'mode': self.settings['retry_mode'], 'max_attempts': self.settings['max_attempts']},
+                      connect_timeout=self.settings['connect_timeout'],
+                      read_timeout=self.settings['read_timeout'])
+
+    def configure(self, **settings):
+        """
+        Replace the settings used to create clients. Settings left out go back to their defaults, so removing a key from
+        the config restores its default on the next invocation.
+
+        Cached clients are only discarded if the settings actually changed, so calling this with the same settings on
+        every invocation keeps warm clients alive.
+
+        :raises ValueError: When given a setting that is not in ClientRegistry.defaults.
+        :param settings: Overrides for any of the keys in ClientRegistry.defaults.
+        """
+        updated = dict(self.defaults, **self._validate(settings))
+
+        if updated != self.settings:
+            with self.lock:
+                self.settings = updated
+                self.clients = dict()
+
+    def clear(self):
+        """Discard every cached client and the session they were created from."""
+        with self.lock:
+            self.session = None
+            self.clients = dict()
+
+    def _validate(self, settings):
+        unknown = set(settings) - set(self.defaults)
+        if unknown:
+            raise ValueError('Unknown client settings: {}'.format(', '.join(sorted(unknown))))
+        return settings
+
+
+registry = ClientRegistry()
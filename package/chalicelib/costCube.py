@@ -0,0 +1,124 @@
+from collections import namedtuple
+import os
+import tempfile
+
+import numpy as np
+
+from chalicelib.spendAnalyzer import dates_between
+
+"""
+Publish processed costs once into a memory-mapped block that other processes can read without copying.
+"""
+
+CubeHandle = namedtuple('CubeHandle', ['path', 'dates', 'index', 'names'])
+CubeHandle.__doc__ = """
+Everything a process needs to attach to a published CostCube. Small enough to pass to workers cheaply.
+
+:param str path: The memory-mapped file holding the costs.
+:param list(str) dates: The date of each column.
+:param dict index: (account, category) -> (first row, last row + 1) of the series for that account and category.
+:param list(str) names: The owner or service name of each row.
+"""
+
+
+class CostCube:
+    """
+    The daily costs of every owner and service of every account, as rows of one memory-mapped array.
+
+    Only the series that exist are stored, one row each, so the block is as large as the costs themselves. Days
+    without a cost are NaN, so an owner with a cost of exactly 0 is kept apart from one with no costs at all.
+
+    A cube is published once by the process that fetched the costs. Workers attach to it with the CubeHandle, which
+    maps the same pages read-only instead of receiving a pickled copy of the nested dictionaries.
+    """
+
+    categories = ('Owner', 'Service')
+
+    def __init__(self, handle, costs, owner=False):
+        self.handle = handle
+        self.costs = costs
+        self.owner = owner
+
+    @classmethod
+    def publish(cls, response_by_account, start_date, end_date, directory=None):
+        """
+        Copy processed management data into a new memory-mapped file.
+
+        :param dict response_by_account: {account: {'Owner': processed, 'Service': processed}}, where processed is in
+                                         the format returned by ReportGenerator.process_records_for_managers.
+        :param str start_date: The first date of the data, in the format YYYY-MM-DD.
+        :param str end_date: The last date of the data, in the format YYYY-MM-DD.
+        :param str directory: Where to create the file. Defaults to the system's temporary directory.
+        :return CostCube: The published cube. Call CostCube.close once every worker is finished with it.
+        """
+        dates = dates_between(start_date, end_date)
+        column = {date: i for i, date in enumerate(dates)}
+
+        index = dict()
+        names = []
+        for acct, acct_data in response_by_account.items():
+            for category in cls.categories:
+                first = len(names)
+                names.extend(name for name in acct_data[category] if name not in ['Total', 'Increase'])
+                index[(acct, category)] = (first, len(names))
+
+        fd, path = tempfile.mkstemp(suffix='.cube', dir=directory)
+        os.close(fd)
+        costs = np.memmap(path, dtype=np.float64, mode='w+', shape=(max(len(names), 1), len(dates)))
+        nan = float('nan')
+        for (acct, category), (first, last) in index.items():
+            data = response_by_account[acct][category]
+            # Fill one account at a time in memory, then write its rows to the map as a single block.
+            block = [[nan] * len(dates) for _ in range(first, last)]
+            for row, name in zip(block, names[first:last]):
+                for date, cost in data[name].items():
+                    if date in column:
+                        row[column[date]] = cost
+            if block:
+                costs[first:last] = block
+        costs.flush()
+
+        return cls(CubeHandle(path, dates, index, names), costs, owner=True)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Map a published cube into this process without copying it.
+
+        :param CubeHandle handle: The handle of the published cube.
+        :return CostCube: A read-only view of the cube.
+        """
+        costs = np.memmap(handle.path, dtype=np.float64, mode='r', shape=(max(len(handle.names), 1), len(handle.dates)))
+        return cls(handle, costs)
+
+    def account_data(self, acct, category, end_date=None):
+        """
+        Rebuild the processed data for one account and category, in the format taken by GraphGenerator.graph_bar.
+
+        :param str acct: The account number, or 'Total'.
+        :param str category: 'Owner' or 'Service'.
+        :param str end_date: The date used to compute 'Increase'. Defaults to the last date in the cube.
+        :return dict: {name: {date: cost, 'Total': total, 'Increase': increase}, 'Total': total, 'Increase': increase}
+        """
+        end_date = end_date or self.handle.dates[-1]
+        first, last = self.handle.index[(acct, category)]
+        dates = self.handle.dates
+        block = self.costs[first:last].tolist()
+
+        data = dict()
+        for row, name in zip(block, self.handle.names[first:last]):
+            # NaN is the only value not equal to itself.
+            costs = {date: cost for date, cost in zip(dates, row) if cost == cost}
+            costs['Total'] = sum(costs.values())
+            costs['Increase'] = costs.get(end_date, 0.0)
+            data[name] = costs
+
+        data['Total'] = sum(costs['Total'] for costs in data.values())
+        data['Increase'] = sum(costs['Increase'] for name, costs in data.items() if name != 'Total')
+        return data
+
+    def close(self):
+        """Release the mapping, deleting the file if this process published it."""
+        self.costs = None
+        if self.owner and os.path.exists(self.handle.path):
+            os.remove(self.handle.path)
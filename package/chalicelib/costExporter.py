@@ -0,0 +1,179 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from chalicelib import clients
+
+"""
+Export the processed costs behind each report, so they can be analyzed without querying Cost Explorer again.
+"""
+
+
+class CostExporter:
+    """
+    Stream processed costs to gzipped JSON Lines and CSV files in a local directory or an s3://bucket/prefix location.
+
+    Each row is the cost of one day, with the columns in CostExporter.columns:
+
+        account         The account number.
+        account_alias   The account name.
+        grouping        'owner' or 'service' for the costs in management reports, 'owner_service' for the costs of
+                        each service used by each owner in individual reports.
+        owner           The owner name, or empty when grouped by service. Owners are grouped into their teams for
+                        'owner' rows, but not for 'owner_service' rows.
+        service         The service name, or empty when grouped by owner.
+        date            The day, in the format YYYY-MM-DD.
+        cost            The cost of the day in dollars.
+
+    Rows are written as they are generated, so exporting holds no more than a line at a time beyond the processed
+    data itself. Accounts shared by several reports are only exported once per period. Files are written locally
+    and, for S3, uploaded when the exporter is closed. An exporter that is aborted instead, because the run failed,
+    leaves no partial files behind.
+    """
+
+    columns = ('account', 'account_alias', 'grouping', 'owner', 'service', 'date', 'cost')
+    formats = ('jsonl', 'csv')
+
+    def __init__(self, destination, name='costs', formats=formats, client_factory=clients.registry):
+        """
+        :raises ValueError: When given an unknown format.
+        :param str destination: A local directory or an s3://bucket/prefix location to write the files to.
+        :param str name: The name of the files, without extensions, eg: 'costs-2019-01-01-2019-01-31'.
+        :param list(str) formats: Any of 'jsonl' and 'csv'.
+        :param client_factory: A callable with the signature of boto3.client, used when writing to S3.
+        """
+        unknown = set(formats) - set(self.formats)
+        if unknown:
+            raise ValueError('Unknown export formats: {}'.format(', '.join(sorted(unknown))))
+
+        self.destination = destination
+        self.client_factory = client_factory
+        self.exported = set()  # (account, grouping, first date, last date) already written
+        self.rows = 0
+        self.closed = False
+
+        self.to_s3 = destination.startswith('s3://')
+        self.directory = tempfile.mkdtemp() if self.to_s3 else destination
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        self.paths = [os.path.join(self.directory, '%s.%s.gz' % (name, f)) for f in formats]
+        self.files = [gzip.open(path, 'wt', newline='') for path in self.paths]
+
+        self.writers = []
+        for f, file in zip(formats, self.files):
+            if f == 'csv':
+                writer = csv.writer(file)
+                writer.writerow(self.columns)
+                self.writers.append(writer.writerow)
+            else:
+                self.writers.append(lambda row, file=file: file.write(json.dumps(dict(zip(self.columns, row))) + '\n'))
+
+    def export_management(self, response_by_account, nums_to_aliases, start_date, end_date):
+        """
+        Export the costs of each account grouped by owner and by service.
+
+        :param dict response_by_account: {account: {'Owner': processed, 'Service': processed}}, where processed is in
+                                         the format returned by ReportGenerator.process_records_for_managers. The
+                                         total across accounts, if present, is left out.
+        :param dict nums_to_aliases: Account numbers mapped to account names.
+        :param str start_date: The first date of the report, in the format YYYY-MM-DD.
+        :param str end_date: The last date of the report, in the format YYYY-MM-DD.
+        """
+        for acct, acct_data in response_by_account.items():
+            for category, grouping in [('Owner', 'owner'), ('Service', 'service')]:
+                if acct == 'Total' or not self._claim(acct, grouping, start_date, end_date):
+                    continue
+                for name, costs in _series(acct_data[category]):
+                    owner, service = (name, '') if grouping == 'owner' else ('', name)
+                    self._write_days(acct, nums_to_aliases[acct], grouping, owner, service, costs)
+
+    def export_individual(self, response_by_account, nums_to_aliases, start_date, end_date):
+        """
+        Export the costs of each service used by each owner in each account.
+
+        :param dict response_by_account: {account: processed}, where processed is in the format returned by
+                                         ReportGenerator.process_records_for_individual. The total across accounts,
+                                         if present, is left out.
+        :param dict nums_to_aliases: Account numbers mapped to account names.
+        :param str start_date: The first date of the report, in the format YYYY-MM-DD.
+        :param str end_date: The last date of the report, in the format YYYY-MM-DD.
+        """
+        for acct, acct_data in response_by_account.items():
+            if acct == 'Total':
+                continue
+            for owner, services in _series(acct_data):
+                if not self._claim(acct, 'owner_service:%s' % owner, start_date, end_date):
+                    continue
+                for service, costs in _series(services):
+                    self._write_days(acct, nums_to_aliases[acct], 'owner_service', owner, service, costs)
+
+    def close(self):
+        """
+        Finish writing the files, uploading them if the destination is in S3.
+
+        :return list(str): The locations of the exported files.
+        """
+        for file in self.files:
+            file.close()
+        self.files = []
+
+        if not self.to_s3:
+            self.closed = True
+            return self.paths
+
+        bucket, _, prefix = self.destination[len('s3://'):].partition('/')
+        s3 = self.client_factory('s3')
+        locations = []
+        for path in self.paths:
+            key = '%s/%s' % (prefix.rstrip('/'), os.path.basename(path)) if prefix else os.path.basename(path)
+            s3.upload_file(path, bucket, key)
+            locations.append('s3://%s/%s' % (bucket, key))
+        shutil.rmtree(self.directory)
+        self.closed = True
+        return locations
+
+    def abort(self):
+        """
+        Stop exporting and delete whatever was written, unless the exporter was already closed.
+
+        Call this when a run fails, so it leaves neither truncated files nor, for S3, a local copy of them behind.
+        """
+        if self.closed:
+            return
+
+        for file in self.files:
+            file.close()
+        self.files = []
+
+        if self.to_s3:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        else:
+            for path in self.paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        self.closed = True
+
+    def _claim(self, acct, grouping, start_date, end_date):
+        """Return True the first time an account's costs are exported for a grouping and period."""
+        key = (acct, grouping, start_date, end_date)
+        if key in self.exported:
+            return False
+        self.exported.add(key)
+        return True
+
+    def _write_days(self, acct, alias, grouping, owner, service, costs):
+        for date, cost in sorted(costs.items()):
+            if date not in ['Total', 'Increase']:
+                row = (acct, alias, grouping, owner, service, date, cost)
+                for write in self.writers:
+                    write(row)
+                self.rows += 1
+
+
+def _series(data):
+    """Iterate over the (name, value) pairs of processed data, leaving out the 'Total' and 'Increase' entries."""
+    return ((name, value) for name, value in data.items() if name not in ['Total', 'Increase'])
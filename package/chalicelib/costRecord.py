@@ -0,0 +1,121 @@
+import sys
+
+from chalicelib.ownerNormalizer import default_normalizer
+
+"""
+A compact representation of the rows contained in an AWS Cost Explorer API response.
+"""
+
+
+class CostRecord:
+    """
+    A single cost entry from a Cost Explorer response.
+
+    Cost Explorer responses are deeply nested dictionaries with a string amount per group per day. Holding on to
+    them, and to the per-key dictionaries built from them, costs several Python objects per row. A CostRecord uses
+    __slots__ and interned strings so that the same owner, service or date is only ever stored once.
+
+    For responses grouped by a single category, the key is stored in whichever of owner or service it belongs to and
+    the other is None.
+    """
+
+    __slots__ = ('date', 'owner', 'service', 'cost')
+
+    def __init__(self, date, owner, service, cost):
+        """
+        :param str date: The start of the time period the cost was incurred in, in the format YYYY-MM-DD.
+        :param str owner: The value of the Owner tag, or None if the response was not grouped by owner.
+        :param str service: The name of the service, or None if the response was not grouped by service.
+        :param float cost: The cost incurred.
+        """
+        self.date = date
+        self.owner = owner
+        self.service = service
+        self.cost = cost
+
+    def __eq__(self, other):
+        return isinstance(other, CostRecord) and (self.date, self.owner, self.service, self.cost) == \
+            (other.date, other.owner, other.service, other.cost)
+
+    def __repr__(self):
+        return 'CostRecord({!r}, {!r}, {!r}, {!r})'.format(self.date, self.owner, self.service, self.cost)
+
+    @property
+    def key(self):
+        """The key a single-category response was grouped by: the owner if present, otherwise the service."""
+        return self.owner if self.owner is not None else self.service
+
+
+def decode_response(response, metric='BlendedCost', release=False, normalizer=None):
+    """
+    Decode a Cost Explorer response into a list of CostRecords.
+
+    Each key is split, normalized and interned once per distinct key rather than once per row, and each amount is
+    converted to a float exactly once. Rows with negative costs are dropped; the API returns large negative numbers
+    associated with '' which would otherwise skew the totals.
+
+    The response is not referenced by the returned records, so it can be released as soon as this returns. If
+    release is set, each day is removed from response['ResultsByTime'] as soon as it has been decoded so that the
+    response and the records are never both held in full.
+
+    :param dict response: The response from the AWS Cost Explorer API.
+    :param str metric: The metric to read the cost from.
+    :param bool release: If true, empty response['ResultsByTime'] while decoding it.
+    :param OwnerNormalizer normalizer: The rules for naming owners. Defaults to reporting empty tags as 'Untagged' and
+                                       instance ids as 'i-*'.
+    :return list(CostRecord): One record per non-negative group per day.
+    """
+    normalizer = normalizer or default_normalizer
+    records = []
+    keys_seen = dict()  # raw key -> (owner, service)
+
+    for day_dict in _iter_days(response, release):
+        date = sys.intern(day_dict['TimePeriod']['Start'])
+
+        for group in day_dict['Groups']:
+            cost = float(group['Metrics'][metric]['Amount'])
+            if cost < 0:
+                continue
+
+            raw_keys = tuple(group['Keys'])
+            decoded = keys_seen.get(raw_keys)
+            if decoded is None:
+                decoded = keys_seen[raw_keys] = _decode_keys(raw_keys, normalizer)
+
+            records.append(CostRecord(date, decoded[0], decoded[1], cost))
+
+    return records
+
+
+def _iter_days(response, release):
+    """
+    Iterate over the days of a response, optionally removing each one from the response as it is yielded.
+
+    :param dict response: The response from the AWS Cost Explorer API.
+    :param bool release: If true, empty response['ResultsByTime'] while iterating.
+    """
+    daily_data = response['ResultsByTime']
+    if not release:
+        yield from daily_data
+        return
+
+    daily_data.reverse()  # Popping from the end keeps the days in order and each pop cheap.
+    while daily_data:
+        yield daily_data.pop()
+
+
+def _decode_keys(raw_keys, normalizer):
+    """
+    Split the Keys of a response group into an owner and a service.
+
+    :param tuple(str) raw_keys: The Keys of the group, eg: ('Owner$someone@email.com', 'Amazon S3').
+    :param OwnerNormalizer normalizer: The rules for naming owners.
+    :return tuple(str): The owner and service, either of which may be None.
+    """
+    owner = service = None
+    for key in raw_keys:
+        if key.startswith('Owner$'):
+            owner = sys.intern(normalizer.canonical(key.split('$', 1)[1]))
+        else:
+            service = sys.intern(key or 'Untagged')
+    return owner, service
@@ -1,5 +1,7 @@
 import copy
 import datetime
+import functools
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
@@ -14,6 +16,19 @@ class GraphGenerator:
     def __init__(self):
         pass
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def load_style(path="chalicelib/.matplotlib/elip12.mplstyle"):
+        """
+        Read a matplotlib style file once. Later calls return the same settings without reading the file again.
+
+        Call GraphGenerator.load_style.cache_clear() to read the file again.
+
+        :param str path: the path to the .mplstyle file, relative to the working directory
+        :return dict: the rcParams defined by the style, which can be passed to plt.style.use
+        """
+        return matplotlib.rc_params_from_file(os.path.abspath(path), use_default_template=False)
+
     @staticmethod
     def list_data(data, name, start_date, end_date, total=False):
         """
@@ -25,7 +40,7 @@ class GraphGenerator:
         :param str end_date: the end date of the data, in the format YYYY-MM-DD
         :param bool total: if set to True, the cost for each day is cumulative, a month-to-date total each day
         :return: tuple in the format ([1, 2, 3, ...], [day 1 cost, day 2 cost, day 3 cost, ...])
-                 for the given person
+                 for the given person, where day 1 is start_date
         """
         start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
         end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
@@ -34,7 +49,7 @@ class GraphGenerator:
         yvals = []
 
         if total:
-            for i in range(end_date.day - start_date.day + 1):
+            for i in range((end_date - start_date).days + 1):
                 xvals.append(i + 1)
                 current_date = (start_date + day * i).strftime("%Y-%m-%d")
                 if current_date in data[name]:
@@ -49,7 +64,7 @@ class GraphGenerator:
                         yvals.append(yvals[-1])
 
         else:
-            for i in range(end_date.day - start_date.day + 1):
+            for i in range((end_date - start_date).days + 1):
                 xvals.append(i + 1)
                 current_date = (start_date + day * i).strftime("%Y-%m-%d")
                 if current_date in data[name]:
@@ -120,49 +135,168 @@ class GraphGenerator:
         """
 
         if dark:
-            plt.style.use(os.path.abspath("chalicelib/.matplotlib/elip12.mplstyle"))  # style definition
+            plt.style.use(GraphGenerator.load_style())  # style definition
 
         plt.figure(figsize=(8, 5))
         axes = plt.axes()
-        axes.xaxis.set_major_locator(ticker.MultipleLocator(1))  # set the tick marks to integer values
 
         # label axes
         plt.xlabel("date")
         plt.ylabel("cost in dollars")
         plt.title(title)
 
-        colors = plt.cm.rainbow(np.linspace(0, 1, len(data)))  # make a unique color for each bar
+        names = GraphGenerator.names(data)
+        colors = dict(zip(names, plt.cm.rainbow(np.linspace(0, 1, len(names)))))  # make a unique color for each bar
 
-        # keep track of where the top of each stacked bar is after each iteration
-        prev = [0 for i in range(int(start_date[-2:]), int(end_date[-2:]) + 1)]  # each bar starts with a height of 0
+        GraphGenerator.plot_bars(axes, data, colors, start_date, end_date, total=total, first=first)
 
-        if first:  # if specified, graph this person's data first so it all appears at the bottom and is easier to read
-            result = GraphGenerator.list_data(data, first, start_date, end_date, total=total)
-            plt.bar(result[0], result[1], bottom=prev, label=first)
-            prev = [result[1][i] for i in range(len(prev))]
+        legend = plt.legend(bbox_to_anchor=(0.5, -0.1), loc="upper center")  # place the legend outside the plot
+
+        return plt, legend
+
+    @staticmethod
+    def graph_panels(panels, title, start_date, end_date, total=False, columns=2, dark=True):
+        """
+        Display several bar graphs as panels of a single matplotlib figure with one legend shared between them.
+
+        Each name is given the same color in every panel it appears in.
+
+        :param list(tuple) panels: (subtitle, data) pairs, where data is in the format taken by GraphGenerator.graph_bar
+        :param str title: title to display above the panels
+        :param str start_date: the start date of the data, in the format YYYY-MM-DD
+        :param str end_date: the end date of the data, in the format YYYY-MM-DD
+        :param bool total: if true, display data as a cumulative total cost each day
+        :param int columns: the number of panels in each row
+        :param bool dark: if true, plot on a dark background
+        :return: matplotlib plot
+        """
 
-        counter = 0  # iteration counter to keep track of which color to use
-        for name in data:
-            if name not in ['Total', 'Increase']:
-                if first:
-                    if name == first:
-                        continue  # if the first person to graph was specified, don't graph their data again
-                result = GraphGenerator.list_data(data, name, start_date, end_date, total=total)
+        if dark:
+            plt.style.use(GraphGenerator.load_style())  # style definition
 
-                if len(result[0]) == 1:  # if only one bar, specify the x range so it doesn't fill the whole plot
-                    axes.set_xlim(0, 2)
+        columns = max(1, min(columns, len(panels)))
+        rows = (len(panels) + columns - 1) // columns
+        figure, axes_grid = plt.subplots(rows, columns, figsize=(8 * columns, 5 * rows), squeeze=False)
+        figure.suptitle(title)
 
-                plt.bar(result[0], result[1], bottom=prev, label=name, color=colors[counter])
+        names = []
+        for _, data in panels:
+            names.extend(name for name in GraphGenerator.names(data) if name not in names)
+        colors = dict(zip(names, plt.cm.rainbow(np.linspace(0, 1, len(names)))))
 
-                # update the value of the height of each stacked bar
-                prev = [result[1][i] + prev[i] for i in range(len(prev))]
+        handles = dict()
+        for (subtitle, data), axes in zip(panels, axes_grid.flat):
+            axes.set_title(subtitle)
+            axes.set_xlabel("date")
+            axes.set_ylabel("cost in dollars")
+            handles.update(GraphGenerator.plot_bars(axes, data, colors, start_date, end_date, total=total))
 
-                counter += 1  # update the iteration counter
+        for axes in axes_grid.flat[len(panels):]:  # hide the spaces left over in the last row
+            axes.set_visible(False)
 
-        legend = plt.legend(bbox_to_anchor=(0.5, -0.1), loc="upper center")  # place the legend outside the plot
+        legend = figure.legend([handles[name] for name in names if name in handles],
+                               [name for name in names if name in handles],
+                               loc="upper center", bbox_to_anchor=(0.5, 0), ncol=min(len(names), 4) or 1)
 
         return plt, legend
 
+    @staticmethod
+    def names(data):
+        """
+        :param dict data: dictionary mapping names to their daily costs, alongside 'Total' and 'Increase'
+        :return list(str): the names in data
+        """
+        return [name for name in data if name not in ['Total', 'Increase']]
+
+    @staticmethod
+    def plot_bars(axes, data, colors, start_date, end_date, total=False, first=None):
+        """
+        Draw the stacked bars for a bar graph onto a set of matplotlib axes.
+
+        :param axes: the matplotlib axes to draw on
+        :param dict data: dictionary mapping names to lists of their daily costs
+        :param dict colors: the color to draw each name in
+        :param str start_date: the start date of the data, in the format YYYY-MM-DD
+        :param str end_date: the end date of the data, in the format YYYY-MM-DD
+        :param bool total: if true, display data as a cumulative total cost each day
+        :param str first: if specified, plot this person's data first so it is easier for them to read
+        :return dict: the bars drawn for each name, for use in a legend
+        """
+        axes.xaxis.set_major_locator(ticker.MultipleLocator(1))  # set the tick marks to integer values
+
+        # bar i is the i-th day of the period, so label each tick with its day of the month
+        first_day = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        axes.xaxis.set_major_formatter(ticker.FuncFormatter(
+            lambda x, pos: (first_day + datetime.timedelta(days=int(x) - 1)).day))
+
+        # keep track of where the top of each stacked bar is after each iteration
+        days = (datetime.datetime.strptime(end_date, "%Y-%m-%d") - first_day).days + 1
+        prev = [0 for i in range(days)]  # each bar starts with a height of 0
+        bars = dict()
+
+        names = GraphGenerator.names(data)
+        if first in names:  # if specified, graph this person's data first so it all appears at the bottom and is easier to read
+            names.remove(first)
+            names.insert(0, first)
+
+        for name in names:
+            result = GraphGenerator.list_data(data, name, start_date, end_date, total=total)
+
+            if len(result[0]) == 1:  # if only one bar, specify the x range so it doesn't fill the whole plot
+                axes.set_xlim(0, 2)
+
+            bars[name] = axes.bar(result[0], result[1], bottom=prev, label=name, color=colors[name])
+
+            # update the value of the height of each stacked bar
+            prev = [result[1][i] + prev[i] for i in range(len(prev))]
+
+        return bars
+
+    @staticmethod
+    def significant(data, threshold):
+        """
+        Leave out the names whose costs are too small to be visible in a bar graph.
+
+        :param dict data: dictionary mapping names to their daily costs, each with a 'Total'
+        :param float threshold: the smallest total cost worth graphing
+        :return dict: a copy of data with only the names whose total is at least threshold
+        """
+        return {name: costs for name, costs in data.items()
+                if name in ['Total', 'Increase'] or costs['Total'] >= threshold}
+
+    @staticmethod
+    def daily_totals(data, start_date, end_date):
+        """
+        Add up the daily costs of every name in data.
+
+        :param dict data: dictionary mapping names to their daily costs
+        :param str start_date: the start date of the data, in the format YYYY-MM-DD
+        :param str end_date: the end date of the data, in the format YYYY-MM-DD
+        :return list(float): the total cost on each day
+        """
+        totals = None
+        for name in GraphGenerator.names(data):
+            costs = GraphGenerator.list_data(data, name, start_date, end_date)[1]
+            totals = costs if totals is None else [t + c for t, c in zip(totals, costs)]
+        return totals or GraphGenerator.list_data({'': {}}, '', start_date, end_date)[1]
+
+    sparks = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+    @staticmethod
+    def sparkline(values):
+        """
+        Draw a series as a line of text, for costs too small to be worth a graph.
+
+        :param list(float) values: the daily costs
+        :return str: one block character per value, the taller the block the larger the cost
+        """
+        top = max(values) if values else 0
+        if top <= 0:
+            return GraphGenerator.sparks[0] * len(values)
+
+        steps = len(GraphGenerator.sparks) - 1
+        return ''.join(GraphGenerator.sparks[int(round(max(v, 0) / top * steps))] for v in values)
+
     @staticmethod
     def clean():
         """Erase everything in the images directory"""
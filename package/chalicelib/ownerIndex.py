@@ -0,0 +1,43 @@
+"""
+Find every cost of an owner without querying Cost Explorer for that owner.
+"""
+
+
+class OwnerIndex:
+    """
+    An inverted index from owner identities to their CostRecords in each account.
+
+    Built once from responses grouped by both owner and service, it serves individual reports for any number of
+    owners. Looking up an owner only touches the accounts they have costs in.
+    """
+
+    def __init__(self):
+        self.entries = dict()  # owner -> {account: [CostRecord]}
+
+    def add(self, acct, records):
+        """
+        Index the records decoded from an account's response.
+
+        :param str acct: The account number the records are from.
+        :param list(CostRecord) records: Records decoded from a response grouped by both owner and service.
+        """
+        for r in records:
+            by_account = self.entries.get(r.owner)
+            if by_account is None:
+                by_account = self.entries[r.owner] = dict()
+            by_account.setdefault(acct, []).append(r)
+
+    def accounts(self, owner):
+        """
+        :param str owner: The owner identity, see OwnerNormalizer.identity.
+        :return list(str): The accounts the owner has costs in, in the order they were indexed.
+        """
+        return list(self.entries.get(owner, dict()))
+
+    def records(self, owner, acct):
+        """
+        :param str owner: The owner identity, see OwnerNormalizer.identity.
+        :param str acct: The account number.
+        :return list(CostRecord): The owner's records in the account.
+        """
+        return self.entries.get(owner, dict()).get(acct, [])
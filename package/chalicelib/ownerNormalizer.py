@@ -0,0 +1,98 @@
+import functools
+import re
+
+"""
+Map the values of the Owner tag onto the names costs are reported under.
+"""
+
+
+class OwnerNormalizer:
+    """
+    Apply a set of rules, compiled once, to turn Owner tag values into canonical owner names.
+
+    The rules come from the "owner_rules" dictionary of config.json and are applied in this order:
+
+        case_fold   If true, compare and report owners in lower case.
+        strip       A list of regular expressions. Every match is removed, eg: ":.*$" drops role session suffixes.
+        aliases     A dictionary of owner names to the name they should be reported under.
+        patterns    A list of [regular expression, owner] pairs. Owners matching an expression are reported as the
+                    given owner. Owners starting with 'i-' (instance ids) are always reported as 'i-*'.
+        teams       A dictionary of owner names to the team they should be reported under.
+
+    An owner that is empty, or becomes empty, is reported as 'Untagged'.
+
+    Every rule but teams decides who an owner is, their identity. Teams only group identities together, so they apply
+    to the costs managers see, never to the costs in an individual's own report; see OwnerNormalizer.without_teams.
+
+    Identities and canonical names are memoized, so the cost of the rules depends on the number of distinct owners rather than the
+    number of rows in a response.
+    """
+
+    def __init__(self, rules=None, cache_size=4096):
+        """
+        :raises ValueError: When given an unknown rule or an invalid regular expression.
+        :param dict rules: The rules described above. Defaults to no rules beyond 'Untagged' and 'i-*'.
+        :param int cache_size: The number of distinct tag values to remember the canonical name of.
+        """
+        rules = rules or dict()
+        self.rules = rules
+        self.cache_size = cache_size
+        unknown = set(rules) - {'case_fold', 'strip', 'aliases', 'patterns', 'teams'}
+        if unknown:
+            raise ValueError('Unknown owner rules: {}'.format(', '.join(sorted(unknown))))
+
+        self.case_fold = bool(rules.get('case_fold'))
+
+        try:
+            # A single alternation removes every match in one pass.
+            self.strip = re.compile('|'.join('(?:%s)' % p for p in rules['strip'])) if rules.get('strip') else None
+            self.patterns = [(re.compile(pattern), owner) for pattern, owner in rules.get('patterns', [])]
+        except re.error as e:
+            raise ValueError('Invalid owner rule: {}'.format(e))
+        self.patterns.append((re.compile('^i-'), 'i-*'))
+
+        self.aliases = self._keys(rules.get('aliases', dict()))
+        self.teams = self._keys(rules.get('teams', dict()))
+
+        self.identity = functools.lru_cache(maxsize=cache_size)(self._identity)
+        self.canonical = functools.lru_cache(maxsize=cache_size)(self._canonical)
+
+    def without_teams(self):
+        """
+        :return OwnerNormalizer: A normalizer with the same rules except teams, whose canonical names are identities.
+        """
+        return OwnerNormalizer({rule: value for rule, value in self.rules.items() if rule != 'teams'}, self.cache_size)
+
+    def _keys(self, mapping):
+        return {k.lower() if self.case_fold else k: v for k, v in mapping.items()}
+
+    def _canonical(self, owner):
+        """
+        :param str owner: The value of the Owner tag, without the 'Owner$' prefix.
+        :return str: The name the owner's costs are reported under: their team if they have one, else their identity.
+        """
+        identity = self.identity(owner)
+        return self.teams.get(identity, identity)
+
+    def _identity(self, owner):
+        """
+        :param str owner: The value of the Owner tag, without the 'Owner$' prefix.
+        :return str: Who the owner is, after every rule except teams.
+        """
+        if self.case_fold:
+            owner = owner.lower()
+        if self.strip:
+            owner = self.strip.sub('', owner)
+        if not owner:
+            return 'Untagged'
+
+        owner = self.aliases.get(owner, owner)
+
+        for pattern, replacement in self.patterns:
+            if pattern.search(owner):
+                return replacement
+
+        return owner
+
+
+default_normalizer = OwnerNormalizer()
@@ -0,0 +1,151 @@
+import contextlib
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from chalicelib import clients
+
+"""
+Opt-in profiling of the stages of a report run.
+
+Enable it by setting the AWSAUDITOR_PROFILE environment variable, or the "profile" key of config.json, to a local
+directory or to an s3://bucket/prefix location. For each stage the Profiler writes:
+
+    <stage>.prof        cProfile stats, readable by pstats, snakeviz, or flameprof to render a flame graph.
+    <stage>.alloc.txt   the source lines that allocated the most memory still held when the stage finished.
+
+along with stages.txt, which summarizes the call count, wall time and peak traced memory of every stage.
+"""
+
+
+class NullProfiler:
+    """A profiler that does nothing. Used whenever profiling is not enabled."""
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        yield
+
+    def save(self):
+        pass
+
+
+class Profiler:
+    """
+    Profile named stages of a run with cProfile and tracemalloc.
+
+    Every call to a stage is accumulated into the same stats, so a stage that runs once per account is reported as
+    a whole. Stages do not nest: a stage entered while another one is being profiled is counted as part of the
+    outer stage.
+    """
+
+    def __init__(self, destination, top=25, client_factory=clients.registry):
+        """
+        :param str destination: A local directory or an s3://bucket/prefix location to write the results to.
+        :param int top: The number of allocation sites to report for each stage.
+        :param client_factory: A callable with the signature of boto3.client, used when writing to S3.
+        """
+        self.destination = destination
+        self.top = top
+        self.client_factory = client_factory
+
+        self.profiles = dict()
+        self.allocations = dict()  # stage -> {allocation site: bytes}
+        self.calls = dict()
+        self.seconds = dict()
+        self.peaks = dict()
+        self._active = None
+        self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Profile the body of a with statement as part of the named stage.
+
+        :param str name: The name of the stage, eg: 'api_call'.
+        """
+        if self._active:
+            yield
+            return
+
+        self._active = name
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        # Forget the allocations of earlier stages, which also resets the peak. Only what the stage allocates is
+        # traced, so a single snapshot at the end shows where its memory went.
+        tracemalloc.clear_traces()
+
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+
+            sites = self.allocations.setdefault(name, dict())
+            for stat in _snapshot().statistics('lineno'):
+                site = str(stat.traceback)
+                sites[site] = sites.get(site, 0) + stat.size
+
+            self._active = None
+
+    def save(self):
+        """Write the results of every stage profiled so far to the destination."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        to_s3 = self.destination.startswith('s3://')
+        directory = tempfile.mkdtemp() if to_s3 else self.destination
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(os.path.join(directory, 'stages.txt'), 'w') as summary:
+            summary.write('{:40} {:>8} {:>12} {:>14}\n'.format('stage', 'calls', 'seconds', 'peak KiB'))
+            for name in sorted(self.calls, key=self.seconds.get, reverse=True):
+                summary.write('{:40} {:8d} {:12.3f} {:14.1f}\n'.format(name, self.calls[name], self.seconds[name],
+                                                                       self.peaks[name] / 1024))
+
+        for name, profile in self.profiles.items():
+            pstats.Stats(profile).dump_stats(os.path.join(directory, '%s.prof' % name))
+
+            sites = sorted(self.allocations[name].items(), key=lambda site: site[1], reverse=True)[:self.top]
+            with open(os.path.join(directory, '%s.alloc.txt' % name), 'w') as f:
+                for site, size in sites:
+                    f.write('{:12.1f} KiB  {}\n'.format(size / 1024, site))
+
+        if to_s3:
+            bucket, _, prefix = self.destination[len('s3://'):].partition('/')
+            s3 = self.client_factory('s3')
+            for file_name in os.listdir(directory):
+                key = '%s/%s' % (prefix.rstrip('/'), file_name) if prefix else file_name
+                s3.upload_file(os.path.join(directory, file_name), bucket, key)
+            shutil.rmtree(directory)
+
+
+def _snapshot():
+    """Take a tracemalloc snapshot, leaving out the memory used by tracemalloc itself."""
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def get_profiler(config=None, client_factory=clients.registry):
+    """
+    Create the profiler requested by the environment or config, if any.
+
+    :param dict config: The parsed config.json. Its "profile" key is used if AWSAUDITOR_PROFILE is not set.
+    :param client_factory: A callable with the signature of boto3.client, used when writing to S3.
+    :return: A Profiler if profiling was requested, otherwise a NullProfiler.
+    """
+    destination = os.environ.get('AWSAUDITOR_PROFILE') or (config or dict()).get('profile')
+    return Profiler(destination, client_factory=client_factory) if destination else NullProfiler()
@@ -0,0 +1,326 @@
+import argparse
+import base64
+from collections import defaultdict
+import datetime
+import gzip
+import io
+import json
+import os
+import smtplib
+
+from chalicelib import clients
+
+"""
+Record the AWS responses and SMTP transactions of a real run and replay them offline.
+
+A recording is a gzipped json bundle. Replaying it drives awsAuditor.main with fake AWS clients that return the
+recorded responses and an SMTP sink that writes each message to a local directory instead of sending it, so a
+production-sized run can be reproduced and profiled without credentials or network access.
+
+From within the package directory:
+
+    python -m chalicelib.replay record bundle.json.gz
+    python -m chalicelib.replay replay bundle.json.gz --outbox /tmp/outbox
+"""
+
+REDACTED = 'redacted'  # Stands in for every secret in a recorded bundle.
+
+
+def _encode(value):
+    """Convert a boto3 response into something json can store, reading any streaming bodies."""
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if hasattr(value, 'read'):  # eg: the botocore StreamingBody returned by s3.get_object
+        return {'__bytes__': base64.b64encode(value.read()).decode('ascii')}
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _redact(response):
+    """
+    Replace the secret in a secretsmanager.get_secret_value response, so bundles never hold credentials.
+
+    A secret holding a json object keeps its keys, eg: the sender's email address, and has every value replaced.
+    Replaying the bundle then logs in to the SMTP sink with the placeholder.
+    """
+    response = dict(response)
+    response.pop('SecretBinary', None)
+    if 'SecretString' in response:
+        try:
+            secret = json.loads(response['SecretString'])
+        except ValueError:
+            secret = None
+        if isinstance(secret, dict):
+            response['SecretString'] = json.dumps({key: REDACTED for key in secret})
+        else:
+            response['SecretString'] = REDACTED
+    return response
+
+
+def _decode(value):
+    """Rebuild a response stored by _encode, turning stored bodies back into readable file-like objects."""
+    if isinstance(value, dict):
+        if set(value) == {'__bytes__'}:
+            return io.BytesIO(base64.b64decode(value['__bytes__']))
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _request_key(service, operation, params):
+    return service, operation, json.dumps(params, sort_keys=True, default=str)
+
+
+def _service_name(args, kwargs):
+    return kwargs['service_name'] if 'service_name' in kwargs else args[0]
+
+
+class Recorder:
+    """
+    Wrap real AWS clients and SMTP connections, keeping a copy of everything that passes through them.
+
+    Pass Recorder.client_factory and Recorder.smtp_factory to awsAuditor.main (or a ReportGenerator), then call
+    Recorder.save once the run is over.
+    """
+
+    def __init__(self, client_factory=clients.registry, smtp_factory=smtplib.SMTP):
+        """
+        :param client_factory: The callable used to create the real AWS clients.
+        :param smtp_factory: The callable used to create the real SMTP connections.
+        """
+        self._client_factory = client_factory
+        self._smtp_factory = smtp_factory
+        self.calls = []
+        self.mail = []
+
+    def client_factory(self, *args, **kwargs):
+        """Create a real AWS client whose API calls are recorded. Accepts the same arguments as boto3.client."""
+        return _RecordingClient(self, _service_name(args, kwargs), self._client_factory(*args, **kwargs))
+
+    def smtp_factory(self, host='', port=0):
+        """Connect to a real mail server, recording every message sent through the connection."""
+        return _RecordingSMTP(self, self._smtp_factory(host, port))
+
+    def save(self, path, **metadata):
+        """
+        Write the recording to a bundle.
+
+        :param str path: Where to write the gzipped json bundle.
+        :param metadata: Anything else worth keeping with the recording, eg: the start and end dates of the run.
+        """
+        bundle = dict(metadata, calls=self.calls, mail=self.mail)
+        with gzip.open(path, 'wt') as f:
+            json.dump(bundle, f, default=str)
+
+
+class _RecordingClient:
+
+    def __init__(self, recorder, service, client):
+        self._recorder = recorder
+        self._service = service
+        self._client = client
+
+    def __getattr__(self, operation):
+        method = getattr(self._client, operation)
+
+        def call(**params):
+            response = _encode(method(**params))
+            recorded = _redact(response) if operation == 'get_secret_value' else response
+            self._recorder.calls.append({'service': self._service, 'operation': operation, 'params': params,
+                                         'response': recorded})
+            return _decode(response)
+
+        return call
+
+
+class _RecordingSMTP:
+
+    def __init__(self, recorder, smtp):
+        self._recorder = recorder
+        self._smtp = smtp
+
+    def __getattr__(self, name):
+        return getattr(self._smtp, name)
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        to_addrs = [to_addrs] if isinstance(to_addrs, str) else list(to_addrs)
+        self._recorder.mail.append({'from': from_addr, 'to': to_addrs,
+                                    'message': msg.decode('utf-8') if isinstance(msg, bytes) else msg})
+        return self._smtp.sendmail(from_addr, to_addrs, msg, *args, **kwargs)
+
+
+class Outbox:
+    """
+    Collect the mail sent through SMTPSinks, optionally writing each message to a directory as a .eml file.
+
+    Pass Outbox.smtp_factory wherever an smtp_factory is accepted to keep reports from being emailed.
+    """
+
+    sender = 'awsauditor@localhost'  # The address reports are sent from when no email credentials are looked up.
+
+    def __init__(self, outbox=None):
+        """
+        :param str outbox: A directory to write each delivered message to as a .eml file. If unspecified, messages
+                           are only kept in Outbox.delivered.
+        """
+        self.outbox = outbox
+        self.delivered = []
+
+        if outbox and not os.path.exists(outbox):
+            os.makedirs(outbox)
+
+    def smtp_factory(self, host='', port=0):
+        """Connect to the local SMTP sink."""
+        return SMTPSink(self)
+
+    def deliver(self, from_addr, to_addrs, msg):
+        """Keep a message sent to the SMTP sink, writing it to the outbox if there is one."""
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+
+        self.delivered.append((from_addr, list(to_addrs), msg))
+
+        if self.outbox:
+            with open(os.path.join(self.outbox, '%04d.eml' % len(self.delivered)), 'wb') as f:
+                f.write(msg)
+
+
+class Replayer(Outbox):
+    """
+    Serve the responses from a recorded bundle through fake AWS clients and collect mail in a local SMTP sink.
+
+    Requests are matched to recorded responses by service, operation and parameters. A request that was made
+    several times is answered with the recorded responses in order, repeating the last one if it is asked for
+    again, so a bundle can be replayed as many times as needed.
+    """
+
+    def __init__(self, bundle, outbox=None):
+        """
+        :param bundle: The path to a bundle written by Recorder.save, or the loaded bundle itself.
+        :param str outbox: A directory to write each delivered message to as a .eml file. If unspecified, messages
+                           are only kept in Replayer.delivered.
+        """
+        if isinstance(bundle, str):
+            with gzip.open(bundle, 'rt') as f:
+                bundle = json.load(f)
+
+        super().__init__(outbox)
+        self.bundle = bundle
+
+        self.responses = defaultdict(list)
+        for call in bundle['calls']:
+            self.responses[_request_key(call['service'], call['operation'], call['params'])].append(call['response'])
+        self.served = defaultdict(int)
+
+    def client_factory(self, *args, **kwargs):
+        """Create a fake AWS client. Accepts the same arguments as boto3.client."""
+        return _ReplayClient(self, _service_name(args, kwargs))
+
+    def respond(self, service, operation, params):
+        """
+        Find the recorded response to a request.
+
+        :raises KeyError: When the request was never made during the recording.
+        :return dict: The recorded response.
+        """
+        key = _request_key(service, operation, params)
+        if key not in self.responses:
+            raise KeyError('No recorded response for {}.{}({})'.format(*key))
+
+        responses = self.responses[key]
+        response = responses[min(self.served[key], len(responses) - 1)]
+        self.served[key] += 1
+        return _decode(response)
+
+
+class _ReplayClient:
+
+    def __init__(self, replayer, service):
+        self._replayer = replayer
+        self._service = service
+
+    def __getattr__(self, operation):
+        def call(**params):
+            return self._replayer.respond(self._service, operation, params)
+        return call
+
+
+class SMTPSink:
+    """A stand-in for smtplib.SMTP that hands every message to an Outbox instead of a mail server."""
+
+    def __init__(self, outbox):
+        self._outbox = outbox
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, user, password, *args, **kwargs):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        self._outbox.deliver(from_addr, to_addrs, msg)
+        return {}
+
+    def quit(self):
+        pass
+
+
+def record(path, start=None, end=None):
+    """
+    Run awsAuditor.main against AWS, sending real email, and save everything it received and sent to a bundle.
+
+    :param str path: Where to write the bundle.
+    :param str start: The first date of the reports, in the format YYYY-MM-DD. Defaults to the 1st of this month.
+    :param str end: The last date of the reports, in the format YYYY-MM-DD. Defaults to today.
+    """
+    from chalicelib import awsAuditor
+
+    start = start or str(datetime.date.today().replace(day=1))
+    end = end or str(datetime.date.today())
+
+    recorder = Recorder()
+    awsAuditor.main(start, end, client_factory=recorder.client_factory, smtp_factory=recorder.smtp_factory)
+    recorder.save(path, start=start, end=end)
+
+
+def replay(path, outbox=None):
+    """
+    Run awsAuditor.main offline against a bundle written by record.
+
+    :param str path: The path to the bundle.
+    :param str outbox: A directory to write the generated emails to.
+    :return Replayer: The replayer, holding the delivered messages.
+    """
+    from chalicelib import awsAuditor
+
+    replayer = Replayer(path, outbox)
+    awsAuditor.main(replayer.bundle['start'], replayer.bundle['end'], client_factory=replayer.client_factory,
+                    smtp_factory=replayer.smtp_factory)
+    return replayer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record and replay awsAuditor runs.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    record_parser = subparsers.add_parser('record', help='run against AWS and save a bundle')
+    record_parser.add_argument('bundle')
+    record_parser.add_argument('--start')
+    record_parser.add_argument('--end')
+
+    replay_parser = subparsers.add_parser('replay', help='run offline from a bundle')
+    replay_parser.add_argument('bundle')
+    replay_parser.add_argument('--outbox')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.bundle, args.start, args.end)
+    else:
+        replay(args.bundle, args.outbox)
@@ -1,5 +1,5 @@
-import boto3
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import concurrent.futures
 import datetime
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -9,7 +9,15 @@ import os
 import re
 import smtplib
 
+from chalicelib import clients
+from chalicelib.costCube import CostCube
+from chalicelib.costRecord import decode_response
 from chalicelib.graphGenerator import GraphGenerator
+from chalicelib.ownerIndex import OwnerIndex
+from chalicelib.ownerNormalizer import OwnerNormalizer
+from chalicelib.profiler import NullProfiler
+from chalicelib.runtime import RuntimeContext
+from chalicelib.spendAnalyzer import top_movers
 
 
 class ReportGenerator:
@@ -25,49 +33,111 @@ class ReportGenerator:
     https://docs.aws.amazon.com/aws-cost-management/latest/APIReference/API_GetCostAndUsage.html
     """
 
-    def __init__(self, start_date, end_date, secret_name=None, granularity='DAILY', metrics=None):
+    max_cached_messages = 8
+    layouts = ('separate', 'grid')
+    panel_columns = 2
+    panel_rows = 6  # Panels beyond this many rows go in another image, keeping each well within Agg's size limits.
+
+    def __init__(self, start_date, end_date, secret_name=None, granularity='DAILY', metrics=None, client_factory=None,
+                 smtp_factory=None, profiler=None, layout='separate', min_series_total=0.01, sparkline_below=1.0,
+                 movers_count=5, owner_rules=None, render_workers=1, runtime=None, response_cache=None, exporter=None,
+                 owner_index=True, sender=None):
         """
-        Create boto3.client and dictionaries that will be used in later functions.
+        Create boto3 clients and dictionaries that will be used in later functions.
 
         Note that your results will be restricted by your boto3 permissions.
 
         In order to take advantage of this class's emailing functionality you must have an email address and password
-        stored in an AWS Secrets Manager. Provide the secret name to the secret_name argument to enable this. Attempts
-        to use this functionality with out configuring it will result in a RuntimeError.
+        stored in an AWS Secrets Manager. Provide the secret name to the secret_name argument to enable this, or a
+        sender for mail servers that need no login. Attempts to use this functionality with out configuring it will
+        result in a RuntimeError.
 
         :param str start_date: The first date of the inquiry. (inclusive)
         :param str end_date: The last date of the inquiry. (exclusive)
         :param str secret_name: The name of the secret in AWS Secret manager used to grab email config.
         :param str granularity: The "resolution" of the data. Must be 'DAILY' or 'MONTHLY'.
         :param list(str) metrics: The metrics returned in the query.
+        :param client_factory: A callable with the signature of boto3.client used to create every AWS client.
+                               Defaults to the shared chalicelib.clients.registry.
+        :param smtp_factory: A callable with the signature of smtplib.SMTP used to connect to the mail server.
+                             Defaults to smtplib.SMTP.
+        :param profiler: A chalicelib.profiler.Profiler to time the stages of each report with. Defaults to none.
+        :param str layout: 'separate' to attach a graph per account and category, or 'grid' to attach a single image
+                           with every graph in a report as a panel.
+        :param float min_series_total: Owners and services that cost less than this in total are left out of graphs.
+        :param float sparkline_below: Accounts that cost less than this in total are not graphed; the report shows
+                                      a text sparkline of their daily costs instead. Accounts with no costs are
+                                      never graphed.
+        :param int movers_count: The number of owners and services whose costs changed the most on end_date to list at
+                               the top of each report. 0 leaves the list out.
+        :param dict owner_rules: The rules for naming owners, see chalicelib.ownerNormalizer.OwnerNormalizer.
+        :param int render_workers: The number of processes to make management report graphs in.
+        :param chalicelib.runtime.RuntimeContext runtime: Where to cache the account directory and email credentials
+                                                          between reports. Defaults to a new RuntimeContext.
+        :param chalicelib.responseCache.ResponseCache response_cache: Where to share Cost Explorer responses with
+                                                                      reports for other periods. Defaults to none.
+        :param chalicelib.costExporter.CostExporter exporter: Where to export the costs behind each report. Defaults to
+                                                              none.
+        :param bool owner_index: If true, individual reports are made from an OwnerIndex built with one query per
+                                 account, rather than from one query per account for each user.
+        :param str sender: The address to send from when secret_name is not given, for mail servers that need no
+                           login such as a chalicelib.replay.Outbox. No credentials are looked up.
         """
+        if layout not in self.layouts:
+            raise ValueError('layout must be one of: {}'.format(', '.join(self.layouts)))
+        self.layout = layout
+        self.min_series_total = min_series_total
+        self.sparkline_below = sparkline_below
+        self.movers_count = movers_count
+        self.normalizer = OwnerNormalizer(owner_rules)
+        # Individual reports are about one person, so their costs are never grouped into teams.
+        self.individual_normalizer = self.normalizer.without_teams()
+        self.render_workers = render_workers
+
         self.start_date = start_date
         self.end_date = end_date
 
+        self.client_factory = client_factory or clients.registry
+        self.runtime = runtime or RuntimeContext(self.client_factory)
+        self.response_cache = response_cache
+        self.exporter = exporter
+        self.use_owner_index = owner_index
+        self.owner_index = None  # Built by the first individual report, see ReportGenerator.build_owner_index.
+        self.smtp_factory = smtp_factory or smtplib.SMTP
+        self.profiler = profiler or NullProfiler()
+        self.made_graphs = set()  # The file names of the account graphs made so far, except the total's.
+        self.messages = OrderedDict()  # The most recently serialized emails, see ReportGenerator.build_message.
+
         self.granularity = granularity
         self.metrics = metrics or ['BlendedCost']
-        self.client = boto3.client('ce', region_name='us-east-1')  # Region needs to be specified; Cost Explorer hosted here.
+        self.client = self.client_factory('ce', region_name='us-east-1')  # Region needs to be specified; Cost Explorer hosted here.
 
-        self.nums_to_aliases, self.aliases_to_nums = self.build_nums_to_aliases_dicts()
+        self.nums_to_aliases, self.aliases_to_nums = self.runtime.cached(
+            ('accounts',), lambda: self.build_nums_to_aliases_dicts(self.client_factory))
         self.account_nums = list(self.nums_to_aliases.keys())
 
         # Making secret_name an optional arg allows the unit tests to run without specifying a secret. At this time,
         # there are no tests that make use of that functionality.
         self.secret_name_set = bool(secret_name)
         if self.secret_name_set:
-            self.email, self.password = self.get_email_credentials(secret_name)
+            self.email, self.password = self.runtime.cached(
+                ('credentials', secret_name),
+                lambda: self.get_email_credentials(secret_name, client_factory=self.client_factory))
+        else:
+            self.email, self.password = sender, None
 
     @staticmethod
-    def get_email_credentials(secret_name, region_name="us-west-2"):
+    def get_email_credentials(secret_name, region_name="us-west-2", client_factory=clients.registry):
         """
         Retrieve email address and password pair from AWS Secrets Manager
 
         :param str secret_name: The id of the secret in AWS. Can be ARN or friendly name
         :param str region_name: The AWS region to look at. Defaults to us-west-2
+        :param client_factory: A callable with the signature of boto3.client used to create the client.
         :return: dict in the format {you@gmail.com: p@ssw0rd}
         """
 
-        client = boto3.client(service_name='secretsmanager', region_name=region_name)  # Create a Secrets Manager client
+        client = client_factory(service_name='secretsmanager', region_name=region_name)  # Create a Secrets Manager client
 
         response = client.get_secret_value(SecretId=secret_name)
         secret = json.loads(response['SecretString'])
@@ -95,15 +165,16 @@ class ReportGenerator:
         return str(next_day).split(' ')[0]  # return just the date component of the datetime.datetime object.
 
     @staticmethod
-    def build_nums_to_aliases_dicts():
+    def build_nums_to_aliases_dicts(client_factory=clients.registry):
         """
         Create two dictionaries that pair account numbers with their aliases and vice versa.
 
         Note that your results will be restricted by your boto3 permissions.
 
+        :param client_factory: A callable with the signature of boto3.client used to create the client.
         :return tuple(dict): A tuple of dictionaries that pairs account numbers with their aliases and vice versa.
         """
-        client = boto3.client('organizations')
+        client = client_factory('organizations')
         response = client.list_accounts()
 
         nums_to_aliases = {account['Id']: account['Name'] for account in response['Accounts']}
@@ -169,19 +240,47 @@ class ReportGenerator:
         :return dict response: The response from the AWS Cost Explorer API. See  for more information.
         """
 
+        query = {'Filter': self.determine_filters(users, account_nums),
+                 'Granularity': self.granularity,
+                 'GroupBy': self.determine_groups(group_by),
+                 'Metrics': self.metrics}
+
+        with self.profiler.stage('api_call'):
+            if self.response_cache is not None and self.granularity == 'DAILY' and \
+                    self.response_cache.covers(self.start_date, self.end_date):
+                response = self.response_cache.get(query, self.start_date, self.end_date,
+                                                   lambda start, end: self.fetch_costs(start, end, **query))
+            else:
+                response = self.fetch_costs(self.start_date, self.end_date, **query)
+
+        return response
+
+    def fetch_costs(self, start_date, end_date, **query):
+        """
+        Make a Cost Explorer query, following any further pages of results.
+
+        :param str start_date: The first date to query, in the format YYYY-MM-DD.
+        :param str end_date: The last date to query, in the format YYYY-MM-DD.
+        :param query: The other parameters of get_cost_and_usage.
+        :return dict: The response, with the days of every page in ResultsByTime.
+        """
         response = self.client.get_cost_and_usage(
-            Filter=self.determine_filters(users, account_nums),
-            Granularity=self.granularity,
-            GroupBy=self.determine_groups(group_by),
-            Metrics=self.metrics,
-            TimePeriod={'End': self.increment_date(self.end_date),  # Cost Explorer API's query has an exclusive upper bound.
-                        'Start': self.start_date}
+            TimePeriod={'End': self.increment_date(end_date),  # Cost Explorer API's query has an exclusive upper bound.
+                        'Start': start_date},
+            **query
         )
 
+        token = response.pop('NextPageToken', None)
+        while token:
+            page = self.client.get_cost_and_usage(
+                TimePeriod={'End': self.increment_date(end_date), 'Start': start_date}, NextPageToken=token, **query)
+            response['ResultsByTime'].extend(page['ResultsByTime'])
+            token = page.get('NextPageToken')
+
         return response
 
     @staticmethod
-    def process_api_response_for_individual(response, end_date):
+    def process_api_response_for_individual(response, end_date, normalizer=None):
         """
         Turns the response from the AWS Cost Explorer API into accessible data for creating individual reports.
 
@@ -221,32 +320,29 @@ class ReportGenerator:
 
         :param dict response: The response from the AWS Cost Explorer API.
         :param str end_date: The last date in the query range. Used to determine how much costs have increased since yesterday.
+        :param OwnerNormalizer normalizer: The rules for naming owners. Defaults to the standard rules.
         :returns defaultdict(defaultdict(dict)) processed: Data from the response organized by service:date:cost.
         """
 
-        # Create dict with the structure {owner: {service: {date: cost}}}
-        processed = defaultdict(lambda: defaultdict(dict))
+        return ReportGenerator.process_records_for_individual(decode_response(response, normalizer=normalizer), end_date)
 
-        daily_data = response['ResultsByTime']
+    @staticmethod
+    def process_records_for_individual(records, end_date):
+        """
+        Organize decoded CostRecords into the structure described in ReportGenerator.process_api_response_for_individual.
 
-        for day_dict in daily_data:
-            date = day_dict['TimePeriod']['Start']
+        :param list(CostRecord) records: Records decoded from a response grouped by both owner and service.
+        :param str end_date: The last date in the query range. Used to determine how much costs have increased since yesterday.
+        :returns defaultdict(defaultdict(dict)) processed: Data from the records organized by owner:service:date:cost.
+        """
 
-            services_used = day_dict['Groups']
-            for s in services_used:
-                owner = s['Keys'][0].split('$')[1] or 'Untagged'
-                cost = float(s['Metrics']['BlendedCost']['Amount'])
-                if cost >= 0:  # The response contained large negative numbers associated with ''. This rules them out.
-                    service = s['Keys'][1]
+        # Create dict with the structure {owner: {service: {date: cost}}}
+        processed = defaultdict(lambda: defaultdict(dict))
 
-                    if owner.startswith('i-'):
-                        owner = 'i-*'
-                        if processed.get(owner) and processed.get(owner).get(service) and processed.get(owner).get(service).get(date):
-                            processed[owner][service][date] += cost
-                        else:
-                            processed[owner][service][date] = cost
-                    else:
-                        processed[owner][service][date] = cost
+        for r in records:
+            dates = processed[r.owner][r.service]
+            # Every owner that normalizes to the same name, eg: instances as 'i-*', adds to the same day.
+            dates[r.date] = dates[r.date] + r.cost if r.date in dates else r.cost
 
         # Calculate totals for each owner, service and overall as well as how much they increased since yesterday.
         everyone_total = 0.0
@@ -273,7 +369,7 @@ class ReportGenerator:
         return processed
 
     @staticmethod
-    def process_api_response_for_managers(response, end_date):
+    def process_api_response_for_managers(response, end_date, normalizer=None):
         """
         Turns the response from the AWS Cost Explorer API into more accessible data.
 
@@ -282,33 +378,29 @@ class ReportGenerator:
         dates and costs.
 
         :param dict response: The response from the AWS Cost Explorer API.
+        :param OwnerNormalizer normalizer: The rules for naming owners. Defaults to the standard rules.
         :returns defaultdict(dict) processed: Data from the response organized by service:date:cost.
         """
 
+        return ReportGenerator.process_records_for_managers(decode_response(response, normalizer=normalizer), end_date)
+
+    @staticmethod
+    def process_records_for_managers(records, end_date):
+        """
+        Organize decoded CostRecords into the structure described in ReportGenerator.process_api_response_for_managers.
+
+        :param list(CostRecord) records: Records decoded from a response grouped by just owner or just service.
+        :param str end_date: The last date in the query range. Used to determine how much costs have increased since yesterday.
+        :returns defaultdict(dict) processed: Data from the records organized by owner (or service):date:cost.
+        """
+
         # Create dict with the structure {owner: {date: cost}}
         processed = defaultdict(lambda: defaultdict())
 
-        daily_data = response['ResultsByTime']
-
-        for day_dict in daily_data:
-            date = day_dict['TimePeriod']['Start']
-            owners = day_dict['Groups']
-            for o in owners:
-                if o['Keys'][0].startswith('Owner$'):
-                    owner = o['Keys'][0].split('$')[1] or 'Untagged'
-                else:
-                    owner = o['Keys'][0] or 'Untagged'
-
-                cost = float(o['Metrics']['BlendedCost']['Amount'])
-                if cost >= 0:
-                    if owner.startswith('i-'):
-                        owner = 'i-*'
-                        if processed.get(owner) and processed.get(owner).get(date):
-                            processed[owner][date] += cost
-                        else:
-                            processed[owner][date] = cost
-                    else:
-                        processed[owner][date] = cost
+        for r in records:
+            dates = processed[r.key]
+            # Every owner that normalizes to the same name, eg: instances as 'i-*', adds to the same day.
+            dates[r.date] = dates[r.date] + r.cost if r.date in dates else r.cost
 
         everyone_total = 0.0
         for owner in processed:
@@ -341,6 +433,45 @@ class ReportGenerator:
                 total = GraphGenerator.merge_dictionaries(total, acct_dic[a])
         return total
 
+    def should_graph(self, data):
+        """
+        Decide whether costs are worth a graph, rather than just a line of text.
+
+        :param dict data: dictionary mapping owners or services to their daily costs, alongside their 'Total'
+        :return bool: True if the total is at least self.sparkline_below and at least one owner or service is large
+                      enough to graph.
+        """
+        if data['Total'] <= 0 or data['Total'] < self.sparkline_below:
+            return False
+        return any(data[name]['Total'] >= self.min_series_total for name in GraphGenerator.names(data))
+
+    def sparkline(self, data):
+        """
+        :param dict data: dictionary mapping owners or services to their daily costs
+        :return str: a text sparkline of the total daily costs
+        """
+        return GraphGenerator.sparkline(GraphGenerator.daily_totals(data, self.start_date, self.end_date))
+
+    def create_movers_section(self, series):
+        """
+        Create a string listing the daily cost series that changed the most on the last day of the report.
+
+        :param iterable series: (label, {date: cost}) pairs, where label is a tuple of strings.
+        :return str: The list, or an empty string if nothing changed noticeably.
+        """
+        with self.profiler.stage('top_movers'):
+            movers = top_movers(series, self.start_date, self.end_date, n=self.movers_count)
+
+        if not movers:
+            return ''
+
+        report = '\nLargest changes on {}\n'.format(self.end_date)
+        for mover in movers:
+            report += '\t\t{:44} ${:.2f}\t\t{}${:.2f} from ${:.2f} avg\n'.format(': '.join(mover.label), mover.cost,
+                                                                            'up ' if mover.change > 0 else 'down ',
+                                                                            abs(mover.change), mover.baseline)
+        return report
+
     def create_management_report_body(self, response_by_account):
         """
         Create a string version of the body of the management report.
@@ -363,6 +494,10 @@ class ReportGenerator:
                 # If money was spent create a report otherwise indicate no activity.
                 if acct_data['Owner']['Total']:
 
+                    # Accounts too cheap to be graphed get a sparkline instead.
+                    if not self.should_graph(acct_data['Owner']):
+                        report += '\t\t\t{}\n'.format(self.sparkline(acct_data['Owner']))
+
                     # total spent for each user
                     for user, expenditures in acct_data['Owner'].items():
                         if user not in ['Total', 'Increase']:  # The total across all users is stored alongside them and should be ignored.
@@ -419,6 +554,10 @@ class ReportGenerator:
                 if data['Total'] and acct_num not in ['Total', 'Increase']:
                     report += '\t\t{}\n'.format(self.nums_to_aliases[acct_num])
 
+                    # Accounts too cheap to be graphed get a sparkline instead.
+                    if not self.should_graph(data[user]):
+                        report += '\t\t\t{}\n'.format(self.sparkline(data[user]))
+
                     # Breakdown by services used.
                     for service, total in data[user].items():
                         if service not in ['Total', 'Increase']:  # The total across all services is stored alongside them and should be ignored.
@@ -440,83 +579,236 @@ class ReportGenerator:
         return report
 
     def create_account_graphics(self, response_by_account, acct):
+        self.render_account_graphics(response_by_account[acct]['Owner'], response_by_account[acct]['Service'],
+                                     self.nums_to_aliases[acct], self.start_date, self.end_date,
+                                     self.min_series_total, self.profiler)
+
+    @staticmethod
+    def render_account_graphics(owner_data, service_data, alias, start_date, end_date, min_series_total,
+                                profiler=None):
+        """
+        Make a graph of an account's costs by owner and one by service and save them as pngs.
+
+        This does not use the ReportGenerator, so it can also be run by render workers.
+
+        :param dict owner_data: The account's processed costs grouped by owner.
+        :param dict service_data: The account's processed costs grouped by service.
+        :param str alias: The name of the account.
+        :param str start_date: The first date of the data, in the format YYYY-MM-DD.
+        :param str end_date: The last date of the data, in the format YYYY-MM-DD.
+        :param float min_series_total: Owners and services that cost less than this are left out of the graphs.
+        :param profiler: A chalicelib.profiler.Profiler to time the graphing with.
+        """
+        profiler = profiler or NullProfiler()
 
         # Name the file by the account name replacing spaces with dashes
-        file_name = self.nums_to_aliases[acct].replace(' ', '-')
+        file_name = alias.replace(' ', '-')
+
+        for data, category in [(owner_data, 'Owner'), (service_data, 'Service')]:
+            with profiler.stage('graph_bar'):
+                plt = GraphGenerator.graph_bar(GraphGenerator.significant(data, min_series_total),
+                                               "%s Costs This Month By %s" % (alias, category), start_date, end_date)
+
+            with profiler.stage('savefig'):
+                plt[0].savefig("/tmp/%s_by_%s.png" % (file_name, category.lower()), bbox_extra_artists=(plt[1],),
+                               bbox_inches='tight', dpi=200)
+                plt[0].close()
+
+    def create_graphics_in_parallel(self, response_by_account, accts):
+        """
+        Make the graphs for several accounts at once in worker processes.
+
+        The costs are published once to a memory-mapped CostCube that every worker maps, rather than being pickled
+        to each worker. If worker processes cannot be started, which is the case on AWS Lambda, the graphs are made
+        one at a time instead, without publishing the cube.
+
+        :param dict response_by_account: A dictionary containing expenditure data organized by account.
+        :param list(str) accts: The accounts to graph.
+        """
+        # Filled in once the cube is published. Workers only start, and read it, when the first graph is submitted.
+        handle = []
+        try:
+            # Each worker attaches to the cube once, so only an account number is sent with each graph.
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.render_workers,
+                                                          initializer=_attach_cube, initargs=(handle,))
+        except (OSError, NotImplementedError):  # No /dev/shm for the pool's semaphores.
+            for acct in accts:
+                self.create_account_graphics(response_by_account, acct)
+            return
+
+        with pool:
+            with self.profiler.stage('publish_cost_cube'):
+                cube = CostCube.publish({acct: response_by_account[acct] for acct in accts}, self.start_date,
+                                        self.end_date)
+            try:
+                handle.append(cube.handle)
+                with self.profiler.stage('render_workers'):
+                    futures = [pool.submit(_render_from_cube, acct, self.nums_to_aliases[acct], self.start_date,
+                                           self.end_date, self.min_series_total) for acct in accts]
+                    for future in futures:
+                        future.result()  # Raise any error from the workers here.
+            finally:
+                pool.shutdown()  # The workers must be done with the cube before it is removed.
+                cube.close()
+
+    def create_management_panel_graphics(self, response_by_account):
+        """
+        Make images with a graph by owner and a graph by service for each account, including the total.
 
-        # Make a graph for this account organized by owner and save it as a png
-        plt_by_owner = GraphGenerator.graph_bar(response_by_account[acct]['Owner'],
-                                                       "%s Costs This Month By Owner" % self.nums_to_aliases[acct],
-                                                       self.start_date, self.end_date)
+        :param dict response_by_account: A dictionary containing expenditure data organized by account.
+        :return list(str): The paths of the images, empty if no account had costs worth graphing.
+        """
+        aliases = [self.nums_to_aliases[acct] for acct in response_by_account if acct != 'Total']
+        file_name = '/tmp/%s_overview' % '-'.join(alias.replace(' ', '-') for alias in aliases)[:100]
 
-        plt_by_owner[0].savefig("/tmp/%s_by_owner.png" % file_name, bbox_extra_artists=(plt_by_owner[1],),
-                                bbox_inches='tight', dpi=200)
-        plt_by_owner[0].close()
+        panels = []
+        for acct, acct_data in response_by_account.items():
+            if self.should_graph(acct_data['Owner']):
+                panels.append(("%s By Owner" % self.nums_to_aliases[acct],
+                               GraphGenerator.significant(acct_data['Owner'], self.min_series_total)))
+                panels.append(("%s By Service" % self.nums_to_aliases[acct],
+                               GraphGenerator.significant(acct_data['Service'], self.min_series_total)))
 
-        # This is commented out because it takes a long time to make both types of graphs. If you want to use both,
-        # just un-comment this section.
-        # Make a graph for this account organized by service and save it as a png
-        plt_by_service = GraphGenerator.graph_bar(response_by_account[acct]['Service'],
-                                                         "%s Costs This Month By Service" % self.nums_to_aliases[acct]
-                                                         , self.start_date, self.end_date)
+        return self.save_panels(panels, "Costs This Month", file_name)
 
-        plt_by_service[0].savefig("/tmp/%s_by_service.png" % file_name, bbox_extra_artists=(plt_by_service[1],),
-                                  bbox_inches='tight', dpi=200)
-        plt_by_service[0].close()
+    def create_individual_panel_graphics(self, response_by_account, user):
+        """
+        Make images with a graph of a user's costs in each account they used, including the total.
+
+        :param dict response_by_account: A dictionary containing the user's expenditure data organized by account.
+        :param str user: The email address of the user the report is about.
+        :return list(str): The paths of the images, empty if the user had no costs to graph.
+        """
+        panels = [(self.nums_to_aliases[acct], GraphGenerator.significant(acct_data[user], self.min_series_total))
+                  for acct, acct_data in response_by_account.items()
+                  if user in acct_data and self.should_graph(acct_data[user])]
+
+        file_name = '/tmp/%s_All-Accounts' % user.split('@')[0]
+        return self.save_panels(panels, "%s's Costs This Month" % user, file_name)
+
+    def save_panels(self, panels, title, file_name):
+        """
+        Render panels into figures of at most panel_rows rows and save each as a png.
+
+        A single figure holding every panel of a report for dozens of accounts would be too large to render, so the
+        panels are split across as many images as needed, numbered in the title and file name.
+
+        :param list(tuple) panels: (subtitle, data) pairs, see GraphGenerator.graph_panels.
+        :param str title: The title of the figures.
+        :param str file_name: Where to save the pngs, without the extension.
+        :return list(str): The paths of the pngs, in the order of the panels.
+        """
+        per_image = self.panel_columns * self.panel_rows
+        images = [panels[i:i + per_image] for i in range(0, len(panels), per_image)]
+
+        paths = []
+        for i, image_panels in enumerate(images):
+            if len(images) == 1:
+                path, image_title = '%s.png' % file_name, title
+            else:
+                path, image_title = '%s-%d.png' % (file_name, i + 1), '%s (%d of %d)' % (title, i + 1, len(images))
+
+            with self.profiler.stage('graph_bar'):
+                plt = GraphGenerator.graph_panels(image_panels, image_title, self.start_date, self.end_date,
+                                                  columns=self.panel_columns)
+
+            with self.profiler.stage('savefig'):
+                plt[0].savefig(path, bbox_extra_artists=(plt[1],), bbox_inches='tight', dpi=200)
+                plt[0].close()
+            paths.append(path)
+
+        return paths
 
     def create_individual_graphics(self, response_by_account, user, acct):
-        plt = GraphGenerator.graph_bar(response_by_account[acct][user], "%s's %s Costs This Month"
-                                              % (user, self.nums_to_aliases[acct]), self.start_date, self.end_date)
+        with self.profiler.stage('graph_bar'):
+            data = GraphGenerator.significant(response_by_account[acct][user], self.min_series_total)
+            plt = GraphGenerator.graph_bar(data, "%s's %s Costs This Month" % (user, self.nums_to_aliases[acct]),
+                                           self.start_date, self.end_date)
 
-        plt[0].savefig("/tmp/%s_%s.png" % (user.split('@')[0], self.nums_to_aliases[acct]), bbox_extra_artists=(plt[1],),
-                       bbox_inches='tight', dpi=200)
-        plt[0].close()
+        with self.profiler.stage('savefig'):
+            plt[0].savefig("/tmp/%s_%s.png" % (user.split('@')[0], self.nums_to_aliases[acct]),
+                           bbox_extra_artists=(plt[1],), bbox_inches='tight', dpi=200)
+            plt[0].close()
 
-    def send_email(self, recipient, email_body, attachments=None):
+    def build_message(self, email_body, attachments=None):
         """
-        Send the report to a recipient.
+        Create and serialize a report email without addressing it.
 
-        It might be necessary to enable third-party access to your email account. If
-        you are using a gmail account you might be prompted to allow this after your first attempted use.
+        The most recent serialized messages are kept, so building the same report with the same attachments again,
+        for instance for another recipient, reuses it instead of re-reading and re-encoding every image.
 
-        :raises RuntimeError: Not providing an AWS Secret Manager secret name at initialization and attempting to use
-                              this function will cause it to break.
-        :param str recipient: the email address to send to
         :param str email_body: a string containing the entire email message
         :param list(str) attachments: list of image files to attach to the email, if desired
+        :return bytes: The message, with every header except To.
         """
-        if self.secret_name_set:
-            sender = self.email
+        attachments = attachments or []
+        # Images are rewritten in place when a report is regenerated, so their modification times are part of the key.
+        key = (email_body, tuple((png, os.path.getmtime(png)) for png in attachments))
 
+        if key in self.messages:
+            self.messages.move_to_end(key)
+        else:
             msg = MIMEMultipart()  # set up the email
             msg['Subject'] = 'Your AWS Expenses - from {} - {}'.format(self.start_date, self.end_date)
-            msg['From'] = sender
-            msg['To'] = recipient
+            msg['From'] = self.email
 
             msg.attach(MIMEText(email_body))
 
-            if attachments:
-                for png in attachments:
+            for png in attachments:
 
-                    # Format the file name into a nice title for the attachment
-                    display_name = re.match(r'/tmp/(.*).png', png).group(1).replace('_', ' ')
+                # Format the file name into a nice title for the attachment
+                display_name = re.match(r'/tmp/(.*).png', png).group(1).replace('_', ' ')
 
-                    with open(png, 'rb') as p:
-                        image = MIMEImage(p.read(), _subtype="png")
-                        image.add_header('Content-Disposition', 'attachment', filename=display_name)
-                    msg.attach(image)
+                with open(png, 'rb') as p:
+                    image = MIMEImage(p.read(), _subtype="png")
+                    image.add_header('Content-Disposition', 'attachment', filename=display_name)
+                msg.attach(image)
 
-            s = smtplib.SMTP('smtp.gmail.com', 587)
-            s.starttls()
-            s.login(sender, self.password)
+            self.messages[key] = msg.as_bytes()
+            if len(self.messages) > self.max_cached_messages:
+                self.messages.popitem(last=False)  # Each message holds all of its images, so only keep a few.
 
-            text = msg.as_string()
+        return self.messages[key]
 
-            s.sendmail(sender, recipient, text)
-            s.quit()
-        else:
+    def send_email(self, recipients, email_body, attachments=None):
+        """
+        Send the report to one or more recipients.
+
+        The message is built once and delivered to every recipient in a single SMTP transaction. Recipients sharing a
+        report are not shown each other's addresses: its To header names only the recipient when there is one, and
+        undisclosed recipients otherwise.
+
+        It might be necessary to enable third-party access to your email account. If
+        you are using a gmail account you might be prompted to allow this after your first attempted use.
+
+        :raises RuntimeError: Not providing an AWS Secret Manager secret name or a sender at initialization and
+                              attempting to use this function will cause it to break.
+        :param list(str) recipients: the email addresses to send to. A single address may be given as a str.
+        :param str email_body: a string containing the entire email message
+        :param list(str) attachments: list of image files to attach to the email, if desired
+        """
+        if not self.email:
             raise RuntimeError('You must specify a value for secret_name in initialization to send an e-mail.')
 
+        if isinstance(recipients, str):
+            recipients = [recipients]
+
+        with self.profiler.stage('send_email'):
+            sender = self.email
+
+            # Address the prebuilt message by prepending its To header. Every recipient gets the same copy, so a
+            # shared report cannot name them all without disclosing them to each other.
+            to = recipients[0] if len(recipients) == 1 else 'undisclosed-recipients:;'
+            text = 'To: {}\n'.format(to).encode('utf-8') + self.build_message(email_body, attachments)
+
+            s = self.smtp_factory('smtp.gmail.com', 587)
+            s.starttls()
+            if self.password is not None:
+                s.login(sender, self.password)
+
+            s.sendmail(sender, recipients, text)
+            s.quit()
+
     def send_management_report(self, recipients, accounts=None, clean=False):
         """
         Email a report, tailored to managers, to a list of recipients.
@@ -529,7 +821,9 @@ class ReportGenerator:
         if not os.path.exists("/tmp/"):  # create directory to store graphs in
             os.mkdir("/tmp/")
 
-        already_made_graphs = os.listdir("/tmp/")  # get all the graphs that are already made so we don't duplicate them
+        # Graphs this generator already made for another report. Graphs left in /tmp by earlier runs may be for
+        # other dates, so they are made again. The total depends on the accounts in the report, so it is never reused.
+        already_made_graphs = self.made_graphs
 
         response_by_account = dict()
         pngs = list()
@@ -545,35 +839,81 @@ class ReportGenerator:
                 response_by_account[acct_num] = {}
                 for category in ['Owner', 'Service']:  # Create a separate report grouped by each of these categories
                     response = self.api_call(account_nums=[acct_num], group_by=category)
-                    processed = self.process_api_response_for_managers(response, self.end_date)
+                    with self.profiler.stage('process_api_response_for_managers'):
+                        records = decode_response(response, release=True, normalizer=self.normalizer)
+                        processed = self.process_records_for_managers(records, self.end_date)
                     response_by_account[acct_num][category] = processed
 
+        if self.exporter:
+            with self.profiler.stage('export'):
+                self.exporter.export_management(response_by_account, self.nums_to_aliases, self.start_date,
+                                                self.end_date)
+
         if len(response_by_account) > 1:  # only include the total across all accounts if there is more than one account
-            response_by_account["Total"] = ReportGenerator.sum_dictionary(response_by_account)
+            with self.profiler.stage('sum_dictionary'):
+                response_by_account["Total"] = ReportGenerator.sum_dictionary(response_by_account)
 
         # Create graphics.
+        if self.layout == 'grid':
+            pngs.extend(self.create_management_panel_graphics(response_by_account))
+
+        to_graph = []
         for acct in response_by_account:  # Add in the total field for purposes of making the text report
 
-            # Name the file by the account name replacing spaces with dashes
-            file_name = self.nums_to_aliases[acct].replace(' ', '-')
+            # Idle accounts are not graphed; the text report marks them as having no or very little activity.
+            if self.layout == 'separate' and self.should_graph(response_by_account[acct]['Owner']):
+                # Name the file by the account name replacing spaces with dashes
+                file_name = self.nums_to_aliases[acct].replace(' ', '-')
 
-            if "%s_by_owner.png" % file_name not in already_made_graphs:
-                self.create_account_graphics(response_by_account, acct)
-            pngs.append("/tmp/%s_by_owner.png" % file_name)
-            pngs.append("/tmp/%s_by_service.png" % file_name)
+                if acct == 'Total' or "%s_by_owner.png" % file_name not in already_made_graphs:
+                    to_graph.append(acct)
+                    if acct != 'Total':
+                        already_made_graphs.add("%s_by_owner.png" % file_name)
+                pngs.append("/tmp/%s_by_owner.png" % file_name)
+                pngs.append("/tmp/%s_by_service.png" % file_name)
 
             response_by_account[acct]['Total'] = max(response_by_account[acct]['Service']['Total'],
                                                      response_by_account[acct]['Owner']['Total'])
 
+        if self.render_workers > 1 and len(to_graph) > 1:
+            self.create_graphics_in_parallel(response_by_account, to_graph)
+        else:
+            for acct in to_graph:
+                self.create_account_graphics(response_by_account, acct)
+
         report = self.create_management_report_body(response_by_account)  # Make the text report
 
+        # Every owner and service of every account, but not the sum across accounts.
+        series = (((self.nums_to_aliases[acct], name), costs)
+                  for acct, acct_data in response_by_account.items() if acct != 'Total'
+                  for category in ['Owner', 'Service']
+                  for name, costs in acct_data[category].items() if name not in ['Total', 'Increase'])
+        report = self.create_movers_section(series) + report
+
         # Send emails.
-        for recipient in recipients:
-            self.send_email(recipient, report, pngs)
+        self.send_email(recipients, report, pngs)
 
         if clean:
             GraphGenerator.clean()  # delete images once they're used
 
+    def build_owner_index(self):
+        """
+        Index the costs of every owner in every account by owner.
+
+        Cost Explorer can only group by two things at once, so this makes one query per account grouped by owner and
+        service, instead of one per account for each user.
+
+        :return OwnerIndex: The costs of every owner, by owner identity and account.
+        """
+        index = OwnerIndex()
+        for acct_num in self.account_nums:
+            if acct_num != 'Total':
+                response = self.api_call(account_nums=[acct_num])
+                with self.profiler.stage('build_owner_index'):
+                    index.add(acct_num, decode_response(response, release=True,
+                                                        normalizer=self.individual_normalizer))
+        return index
+
     def send_individual_report(self, user, recipients=None, accounts=None, clean=False):
         """
         Email a report detailing the expenditures of a given user.
@@ -595,18 +935,39 @@ class ReportGenerator:
 
         # Determine expenditures for the user across all accounts.
         response_by_account = dict()
-        for acct_num in accounts:
-            if acct_num != 'Total':
-                response = self.api_call([user], [acct_num])
-                processed = self.process_api_response_for_individual(response, self.end_date)
-                if processed['Total'] > 0:
-                    response_by_account[acct_num] = processed
-
-        if user == "":
-            user = "Untagged"
+        if self.use_owner_index:
+            if self.owner_index is None:
+                self.owner_index = self.build_owner_index()
+
+            owner = self.individual_normalizer.canonical(user)
+            for acct_num in self.owner_index.accounts(owner):  # Only the accounts the user has costs in.
+                if acct_num in accounts:
+                    with self.profiler.stage('process_api_response_for_individual'):
+                        processed = self.process_records_for_individual(self.owner_index.records(owner, acct_num),
+                                                                        self.end_date)
+                    if processed['Total'] > 0:
+                        response_by_account[acct_num] = processed
+        else:
+            for acct_num in accounts:
+                if acct_num != 'Total':
+                    response = self.api_call([user], [acct_num])
+                    with self.profiler.stage('process_api_response_for_individual'):
+                        records = decode_response(response, release=True, normalizer=self.individual_normalizer)
+                        processed = self.process_records_for_individual(records, self.end_date)
+                    if processed['Total'] > 0:
+                        response_by_account[acct_num] = processed
+
+        if self.exporter:
+            with self.profiler.stage('export'):
+                self.exporter.export_individual(response_by_account, self.nums_to_aliases, self.start_date,
+                                                self.end_date)
+
+        # The user's costs are filed under their identity, eg: 'Untagged', never under their team.
+        user = self.individual_normalizer.canonical(user)
 
         if len(response_by_account) > 1:  # only include the total across all accounts if there is more than one account
-            response_by_account["Total"] = ReportGenerator.sum_dictionary(response_by_account)
+            with self.profiler.stage('sum_dictionary'):
+                response_by_account["Total"] = ReportGenerator.sum_dictionary(response_by_account)
 
         if not os.path.exists("/tmp/"):
             os.mkdir("/tmp/")
@@ -614,16 +975,42 @@ class ReportGenerator:
             os.mkdir("/tmp/%s" % user)
 
         # Create graphics.
-        for acct in response_by_account:  # one of these is "Total" not an account number
-            if user in response_by_account[acct]:  # create graphical reports
-                self.create_individual_graphics(response_by_account, user, acct)
-                pngs.append("/tmp/%s_%s.png" % (user.split('@')[0], self.nums_to_aliases[acct]))
+        if self.layout == 'grid':
+            pngs.extend(self.create_individual_panel_graphics(response_by_account, user))
+        else:
+            for acct in response_by_account:  # one of these is "Total" not an account number
+                if user in response_by_account[acct] and self.should_graph(response_by_account[acct][user]):
+                    self.create_individual_graphics(response_by_account, user, acct)
+                    pngs.append("/tmp/%s_%s.png" % (user.split('@')[0], self.nums_to_aliases[acct]))
 
         report = self.create_individual_report_body(user, response_by_account)
 
-        for recipient in recipients:  # Send emails
-            self.send_email(recipient, report, pngs)  # send the text and graphs together in an email
+        series = (((self.nums_to_aliases[acct], service), costs)
+                  for acct, acct_data in response_by_account.items() if acct != 'Total' and user in acct_data
+                  for service, costs in acct_data[user].items() if service not in ['Total', 'Increase'])
+        report = self.create_movers_section(series) + report
+
+        self.send_email(recipients, report, pngs)  # send the text and graphs together in an email
 
         if clean:
             GraphGenerator.clean()  # delete images once they're used
 
+
+_worker_cube = None  # The CostCube attached to by this render worker, see _attach_cube.
+
+
+def _attach_cube(handle):
+    """
+    Attach a render worker to a published CostCube. Runs once as each worker starts.
+
+    :param list handle: The CubeHandle of the published cube, in a list filled in after the pool was created.
+    """
+    global _worker_cube
+    _worker_cube = CostCube.attach(handle[0])
+
+
+def _render_from_cube(acct, alias, start_date, end_date, min_series_total):
+    """Make an account's graphs from the CostCube this render worker is attached to."""
+    ReportGenerator.render_account_graphics(_worker_cube.account_data(acct, 'Owner', end_date),
+                                            _worker_cube.account_data(acct, 'Service', end_date),
+                                            alias, start_date, end_date, min_series_total)
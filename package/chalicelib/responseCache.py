@@ -0,0 +1,60 @@
+import json
+
+"""
+Share Cost Explorer responses between reports for different periods.
+"""
+
+
+class ResponseCache:
+    """
+    Fetch each distinct Cost Explorer query once for a whole date range, and answer it for any period within it.
+
+    Used when backfilling reports for several periods: each query is made once for the union of the periods, and the
+    report for each period is made from the days of that response falling inside the period. Only daily responses can
+    be sliced this way.
+    """
+
+    def __init__(self, start_date, end_date):
+        """
+        :param str start_date: The first date of every period that will be asked for, in the format YYYY-MM-DD.
+        :param str end_date: The last date of every period that will be asked for, in the format YYYY-MM-DD.
+        """
+        self.start_date = start_date
+        self.end_date = end_date
+        self.responses = dict()
+        self.fetches = 0
+
+    def covers(self, start_date, end_date):
+        """
+        :return bool: True if the period from start_date to end_date is within the cached range.
+        """
+        return self.start_date <= start_date and end_date <= self.end_date
+
+    def get(self, query, start_date, end_date, fetch):
+        """
+        Answer a query for a period, fetching it for the whole range the first time it is asked for.
+
+        :param dict query: The parameters of the query other than its TimePeriod, which identify it.
+        :param str start_date: The first date of the period, in the format YYYY-MM-DD.
+        :param str end_date: The last date of the period, in the format YYYY-MM-DD.
+        :param fetch: A callable taking a start and end date that makes the query for that range.
+        :return dict: A response holding only the days from start_date to end_date. It can be safely emptied by
+                      chalicelib.costRecord.decode_response without affecting the cache.
+        """
+        key = json.dumps(query, sort_keys=True)
+        if key not in self.responses:
+            self.responses[key] = fetch(self.start_date, self.end_date)
+            self.fetches += 1
+
+        return self.slice(self.responses[key], start_date, end_date)
+
+    @staticmethod
+    def slice(response, start_date, end_date):
+        """
+        :param dict response: A daily response from the AWS Cost Explorer API.
+        :param str start_date: The first date to keep, in the format YYYY-MM-DD.
+        :param str end_date: The last date to keep, in the format YYYY-MM-DD.
+        :return dict: A shallow copy of response with a new list of only the days from start_date to end_date.
+        """
+        days = [day for day in response['ResultsByTime'] if start_date <= day['TimePeriod']['Start'] <= end_date]
+        return dict(response, ResultsByTime=days)
@@ -0,0 +1,94 @@
+import json
+
+from botocore.exceptions import ClientError
+
+from chalicelib import clients
+from chalicelib.graphGenerator import GraphGenerator
+
+"""
+State kept between warm invocations of the lambda.
+
+A lambda container that is reused for another invocation keeps its module level objects. The module level `context`
+holds everything a run sets up before it can start reporting, so a warm run only asks S3 whether the config changed.
+"""
+
+
+class RuntimeContext:
+    """
+    Cache the config, account directory and email credentials of a run, and hand out its clients.
+
+    Cached values are kept until they are invalidated. The config is the exception: every call to
+    RuntimeContext.config revalidates it against its ETag in S3, so edits to config.json take effect on the next run.
+    """
+
+    kinds = ('config', 'accounts', 'credentials', 'style', 'clients')
+
+    def __init__(self, client_factory=clients.registry):
+        """
+        :param client_factory: A callable with the signature of boto3.client used to create every AWS client.
+        """
+        self.client_factory = client_factory
+        self.values = dict()  # (kind, ...) -> value
+        self.etags = dict()   # (bucket, path) -> ETag of the cached config
+
+    def cached(self, key, load):
+        """
+        Get a cached value, loading it the first time it is asked for.
+
+        :param tuple key: The kind of value, eg: 'accounts', followed by anything that identifies it.
+        :param load: A callable taking no arguments that returns the value.
+        :return: The value.
+        """
+        if key not in self.values:
+            self.values[key] = load()
+        return self.values[key]
+
+    def config(self, bucket, path):
+        """
+        Get the parsed config, downloading it again only if it changed in S3.
+
+        :param str bucket: The name of the bucket the config is stored in.
+        :param str path: The path to the config in bucket.
+        :return dict: The parsed config.
+        """
+        key = ('config', bucket, path)
+        etag = self.etags.get((bucket, path)) if key in self.values else None
+        s3 = self.client_factory('s3')
+
+        try:
+            if etag:
+                file = s3.get_object(Bucket=bucket, Key=path, IfNoneMatch=etag)
+            else:
+                file = s3.get_object(Bucket=bucket, Key=path)
+        except ClientError as e:
+            if e.response.get('Error', dict()).get('Code') in ('304', 'NotModified'):
+                return self.values[key]
+            raise
+
+        self.values[key] = json.loads(file['Body'].read())
+        self.etags[(bucket, path)] = file.get('ETag')
+        return self.values[key]
+
+    def invalidate(self, *kinds):
+        """
+        Forget cached values, so the next run loads them again.
+
+        :raises ValueError: When given a kind that is not in RuntimeContext.kinds.
+        :param kinds: The kinds of value to forget: 'config', 'accounts', 'credentials', 'style' or 'clients'.
+                      Everything is forgotten if none are given.
+        """
+        unknown = set(kinds) - set(self.kinds)
+        if unknown:
+            raise ValueError('Unknown kinds to invalidate: {}'.format(', '.join(sorted(map(str, unknown)))))
+        kinds = set(kinds) or set(self.kinds)
+
+        self.values = {key: value for key, value in self.values.items() if key[0] not in kinds}
+        if 'config' in kinds:
+            self.etags = dict()
+        if 'style' in kinds:
+            GraphGenerator.load_style.cache_clear()
+        if 'clients' in kinds and isinstance(self.client_factory, clients.ClientRegistry):
+            self.client_factory.clear()
+
+
+context = RuntimeContext()
@@ -0,0 +1,114 @@
+from collections import namedtuple
+import datetime
+import heapq
+import itertools
+
+import numpy as np
+
+"""
+Find the daily cost series that changed the most on the last day of a report.
+"""
+
+Mover = namedtuple('Mover', ['label', 'cost', 'change', 'baseline', 'zscore'])
+Mover.__doc__ = """
+A series whose cost on the last day stood out.
+
+:param tuple(str) label: What the series is the cost of, eg: (account alias, owner).
+:param float cost: The cost on the last day.
+:param float change: The cost on the last day minus the cost the day before.
+:param float baseline: The mean daily cost over the days before the last.
+:param float zscore: How many standard deviations the last day is from the baseline.
+"""
+
+
+def dates_between(start_date, end_date):
+    """
+    :param str start_date: The first date, in the format YYYY-MM-DD.
+    :param str end_date: The last date, in the format YYYY-MM-DD.
+    :return list(str): Every date from start_date to end_date inclusive, in the format YYYY-MM-DD.
+    """
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+    return [str(start + datetime.timedelta(days=i)) for i in range((end - start).days + 1)]
+
+
+def build_matrix(series, dates):
+    """
+    Lay out daily cost series as the rows of a matrix.
+
+    :param iterable series: (label, {date: cost}) pairs. Any key of the dictionary that is not in dates is ignored, so
+                            the 'Total' and 'Increase' entries of processed responses can be passed in as they are.
+    :param list(str) dates: The dates to use as columns.
+    :return tuple: The labels, in row order, and a (len(labels), len(dates)) array of costs. Missing days are 0.
+    """
+    # One C-level lookup per series and date, streamed straight into the matrix without a list per row.
+    labels, rows = [], []
+    zeros = itertools.repeat(0.0)
+    for label, costs in series:
+        labels.append(label)
+        rows.append(map(costs.get, dates, zeros))
+
+    matrix = np.fromiter(itertools.chain.from_iterable(rows), dtype=float, count=len(labels) * len(dates))
+    return labels, matrix.reshape(len(labels), len(dates))
+
+
+def zscores(matrix, window=7):
+    """
+    Score every day of every series against the rolling baseline of the days before it.
+
+    :param numpy.ndarray matrix: Daily costs, one series per row.
+    :param int window: The number of previous days in the baseline.
+    :return tuple(numpy.ndarray): The baseline means, standard deviations and z-scores, each shaped like matrix.
+                                  The first day has no baseline, so its mean and standard deviation are 0.
+    """
+    # Cumulative sums with a leading 0 let the sum over any window be taken as a difference of two columns.
+    zeros = np.zeros((matrix.shape[0], 1))
+    sums = np.concatenate([zeros, np.cumsum(matrix, axis=1)], axis=1)
+    squares = np.concatenate([zeros, np.cumsum(matrix ** 2, axis=1)], axis=1)
+
+    days = np.arange(matrix.shape[1])
+    starts = np.maximum(days - window, 0)
+    counts = np.maximum(days - starts, 1)
+
+    mean = (sums[:, days] - sums[:, starts]) / counts
+    variance = (squares[:, days] - squares[:, starts]) / counts - mean ** 2
+    std = np.sqrt(np.maximum(variance, 0.0))
+
+    deviation = matrix - mean
+    # A flat baseline makes any change infinitely surprising; measure it against a cent instead.
+    scores = deviation / np.maximum(std, 0.01)
+
+    return mean, std, scores
+
+
+def top_movers(series, start_date, end_date, n=5, window=7, min_change=1.0):
+    """
+    Find the series whose cost on end_date changed the most relative to their recent history.
+
+    Every series is scored in one pass over a matrix of all of them, and only those that changed by at least
+    min_change since the day before are ranked, with a heap, by the size of their z-score.
+
+    :param iterable series: (label, {date: cost}) pairs.
+    :param str start_date: The first date of the series, in the format YYYY-MM-DD.
+    :param str end_date: The date to find movers on, in the format YYYY-MM-DD.
+    :param int n: The most movers to return.
+    :param int window: The number of days before end_date that make up the baseline.
+    :param float min_change: The smallest change since the day before worth reporting, in dollars.
+    :return list(Mover): The movers, largest first.
+    """
+    dates = dates_between(start_date, end_date)
+    if len(dates) < 2 or n <= 0:
+        return []
+
+    labels, matrix = build_matrix(series, dates)
+    if not labels:
+        return []
+
+    mean, std, scores = zscores(matrix, window)
+    change = matrix[:, -1] - matrix[:, -2]
+    last = scores[:, -1]
+
+    candidates = np.flatnonzero(np.abs(change) >= min_change)
+    top = heapq.nlargest(n, candidates, key=lambda i: abs(last[i]))
+
+    return [Mover(labels[i], float(matrix[i, -1]), float(change[i]), float(mean[i, -1]), float(last[i])) for i in top]
@@ -0,0 +1,230 @@
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from awsAuditor import clients, group_managers, main, month_period, parse_args, render_policy, run
+from replay import Outbox
+from reportGenerator import ReportGenerator
+from responseCache import ResponseCache
+
+"""
+The test suite for awsAuditor.
+"""
+
+
+class FakeAWS:
+    """Stands in for boto3.client, answering Cost Explorer with $1 a day for every day and owner asked for."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, service_name, **kwargs):
+        return self
+
+    def list_accounts(self, **params):
+        return {'Accounts': [{'Id': '1234', 'Name': 'Account 1'}]}
+
+    def get_secret_value(self, **params):
+        return {'SecretString': json.dumps({'sender@email.com': 'password'})}
+
+    def get_cost_and_usage(self, **params):
+        self.queries.append(params['TimePeriod'])
+        tags = [f['Tags'] for f in params['Filter'].get('And', []) if 'Tags' in f]
+        owners = tags[0]['Values'] if tags else ['user1', 'user2']
+        groups = [{'Keys': ['Owner$' + owner if group['Key'] == 'Owner' else 'service1' for group in params['GroupBy']],
+                   'Metrics': {'BlendedCost': {'Amount': '1.0', 'Unit': 'USD'}}} for owner in owners]
+
+        day = datetime.datetime.strptime(params['TimePeriod']['Start'], '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(params['TimePeriod']['End'], '%Y-%m-%d').date()
+        days = []
+        while day < end:
+            days.append({'TimePeriod': {'Start': str(day), 'End': str(day + datetime.timedelta(days=1))},
+                         'Groups': groups})
+            day += datetime.timedelta(days=1)
+        return {'ResultsByTime': days}
+
+
+class ThreeAccountAWS(FakeAWS):
+    """A FakeAWS for an organization of three accounts."""
+
+    def list_accounts(self, **params):
+        return {'Accounts': [{'Id': str(a), 'Name': 'Account %d' % a} for a in range(1, 4)]}
+
+
+class AwsAuditorTest(unittest.TestCase):
+
+    config = {'managers': {'manager1@email.com': ['Account 1'], 'manager2@email.com': ['Account 1']},
+              'users': ['user1', 'user2'], 'secret_name': 'secret', 'top_movers': 0}
+
+    def testGroupManagers(self):
+        """Ensure that managers of the same set of accounts share a report, regardless of the order they were listed in."""
+        manager_accounts = {'manager1@email.com': ['Account1', 'Account2'],
+                            'manager2@email.com': ['Account3'],
+                            'manager3@email.com': ['Account2', 'Account1']}
+
+        expected = {('Account1', 'Account2'): ['manager1@email.com', 'manager3@email.com'],
+                    ('Account3',): ['manager2@email.com']}
+
+        self.assertEqual(expected, group_managers(manager_accounts))
+
+    def testRenderPolicy(self):
+        """Ensure that the render policy only passes on known settings, with the top level keys taking precedence."""
+        config = {'chart_layout': 'grid', 'render_policy': {'layout': 'separate', 'sparkline_below': 5.0,
+                                                            'top_movers': 3}}
+        self.assertEqual({'layout': 'grid', 'sparkline_below': 5.0, 'movers_count': 3}, render_policy(config))
+
+        for policy in [{'sparkline_bellow': 5.0}, {'secret_name': 'other'}, {'profiler': None}]:
+            with self.assertRaises(ValueError):
+                main('2019-01-01', '2019-01-03', client_factory=FakeAWS(), smtp_factory=Outbox().smtp_factory,
+                     config=dict(self.config, render_policy=policy))
+
+    def testClientConfigOnlyTunesSharedClients(self):
+        """Ensure that a run with its own client factory leaves the settings of the shared clients alone."""
+        # awsAuditor's own chalicelib.clients, which holds the registry shared by every run.
+        settings = dict(clients.registry.settings)
+
+        main('2019-01-01', '2019-01-03', client_factory=FakeAWS(), smtp_factory=Outbox().smtp_factory,
+             config=dict(self.config, client_config={'max_pool_connections': 5}))
+
+        self.assertEqual(settings, clients.registry.settings)
+
+    def testMonthPeriod(self):
+        """Ensure that a month covers each of its days, and no days after today."""
+        self.assertEqual(('2019-02-01', '2019-02-28'), month_period('2019-02'))
+        self.assertEqual(('2020-02-01', '2020-02-29'), month_period('2020-02'))
+
+        today = datetime.date.today()
+        self.assertEqual((str(today.replace(day=1)), str(today)), month_period(today.strftime('%Y-%m')))
+
+    def testBackfill(self):
+        """Ensure that reports for several periods are made from a single query for the range spanning them."""
+        aws = FakeAWS()
+        outbox = Outbox()
+
+        main(client_factory=aws, smtp_factory=outbox.smtp_factory, config=self.config,
+             periods=[('2019-01-01', '2019-01-31'), ('2019-02-01', '2019-02-28')])
+
+        # One query by owner and one by service for the management report, and one by both for the individual reports.
+        self.assertEqual([{'Start': '2019-01-01', 'End': '2019-03-01'}] * 3, aws.queries)
+        self.assertEqual([['manager1@email.com', 'manager2@email.com'], ['user1'], ['user2']] * 2,
+                         [to for _, to, _ in outbox.delivered])
+
+    def testRecipientFilters(self):
+        """Ensure that only the recipients asked for are sent reports."""
+        aws = FakeAWS()
+        outbox = Outbox()
+
+        main('2019-01-01', '2019-01-31', client_factory=aws, smtp_factory=outbox.smtp_factory, config=self.config,
+             managers=[], users=['user2'])
+
+        self.assertEqual([{'Start': '2019-01-01', 'End': '2019-02-01'}], aws.queries)
+        self.assertEqual([['user2']], [to for _, to, _ in outbox.delivered])
+
+    def testExport(self):
+        """Ensure that the costs behind every report are exported when the config asks for it."""
+        directory = tempfile.mkdtemp()
+        try:
+            main(client_factory=FakeAWS(), smtp_factory=Outbox().smtp_factory,
+                 config=dict(self.config, export=directory, export_formats=['jsonl']),
+                 periods=[('2019-01-01', '2019-01-02'), ('2019-01-03', '2019-01-03')])
+
+            with gzip.open(os.path.join(directory, 'costs-2019-01-01-2019-01-03.jsonl.gz'), 'rt') as f:
+                rows = [json.loads(line) for line in f]
+        finally:
+            shutil.rmtree(directory)
+
+        # Each of the two owners, the service, and each of the two users' services, for each of the 3 days.
+        self.assertEqual(15, len(rows))
+        self.assertEqual({'owner', 'service', 'owner_service'}, {row['grouping'] for row in rows})
+
+    def testExportAborted(self):
+        """Ensure that a run that fails part way through leaves no partial export behind."""
+        def failing_smtp_factory(host, port):
+            raise ConnectionError('The mail server is down')
+
+        directory = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(ConnectionError):
+                main('2019-01-01', '2019-01-03', client_factory=FakeAWS(), smtp_factory=failing_smtp_factory,
+                     config=dict(self.config, export=directory))
+            self.assertEqual([], os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+    def testTeamsStayOutOfIndividualReports(self):
+        """Ensure that a user's report holds only their own costs, even when their team is configured."""
+        for owner_index in [True, False]:
+            outbox = Outbox()
+            r = ReportGenerator('2019-01-01', '2019-01-03', secret_name='secret', client_factory=FakeAWS(),
+                                smtp_factory=outbox.smtp_factory, movers_count=0, owner_index=owner_index,
+                                owner_rules={'teams': {'user1': 'team', 'user2': 'team'}})
+
+            r.send_individual_report('user1')
+
+            message = outbox.delivered[0][2]
+            self.assertIn(b'user1', message)
+            self.assertNotIn(b'team', message)
+            self.assertIn(b'$3.00', message)  # $1 a day for 3 days, without user2's $3.
+            self.assertNotIn(b'$6.00', message)
+
+    def testTotalGraphRedrawn(self):
+        """Ensure that account graphs are reused between management reports, but the total graph is not."""
+        r = ReportGenerator('2019-01-01', '2019-01-03', secret_name='secret', client_factory=ThreeAccountAWS(),
+                            smtp_factory=Outbox().smtp_factory, movers_count=0)
+        drawn = []
+        create_account_graphics = r.create_account_graphics
+        r.create_account_graphics = lambda response_by_account, acct: (drawn.append(acct),
+                                                                       create_account_graphics(response_by_account, acct))
+
+        r.send_management_report(['manager1@email.com'], ['Account 1', 'Account 2'])
+        r.send_management_report(['manager2@email.com'], ['Account 1', 'Account 2', 'Account 3'])
+
+        self.assertEqual(['1', '2', 'Total', '3', 'Total'], drawn)
+
+    def testGridLayout(self):
+        """Ensure that with the grid layout each report is sent with a single image of all its graphs."""
+        outbox = Outbox()
+
+        main('2019-01-01', '2019-01-03', client_factory=ThreeAccountAWS(), smtp_factory=outbox.smtp_factory,
+             config=dict(self.config, chart_layout='grid',
+                         managers={'manager1@email.com': ['Account 1', 'Account 2', 'Account 3']}),
+             users=['user1'])
+
+        self.assertEqual([['manager1@email.com'], ['user1']], [to for _, to, _ in outbox.delivered])
+        management, individual = [message for _, _, message in outbox.delivered]
+        self.assertEqual(1, management.count(b'Content-Type: image/png'))
+        self.assertIn(b'Account-1-Account-2-Account-3 overview', management)
+        self.assertEqual(1, individual.count(b'Content-Type: image/png'))
+        self.assertIn(b'user1 All-Accounts', individual)
+
+    def testOutputWithoutSecret(self):
+        """Ensure that writing reports to an outbox needs no email credentials."""
+        aws = FakeAWS()
+        aws.get_secret_value = None  # Fails the run if credentials are looked up.
+        directory = tempfile.mkdtemp()
+        try:
+            config_path = os.path.join(directory, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump({'managers': {'manager1@email.com': ['Account 1']}, 'users': ['user1']}, f)
+
+            outbox = run(parse_args(['--config', config_path, '--period', '2019-01-01', '2019-01-03',
+                                     '--output', os.path.join(directory, 'outbox')]), client_factory=aws)
+
+            self.assertEqual([['manager1@email.com'], ['user1']], [to for _, to, _ in outbox.delivered])
+            self.assertEqual(['0001.eml', '0002.eml'], sorted(os.listdir(os.path.join(directory, 'outbox'))))
+        finally:
+            shutil.rmtree(directory)
+
+    def testSliceResponse(self):
+        """Ensure that a slice of a cached response holds only the days of its period, and leaves the cache intact."""
+        response = FakeAWS().get_cost_and_usage(TimePeriod={'Start': '2019-01-30', 'End': '2019-02-03'}, Filter=dict(),
+                                                GroupBy=[{'Type': 'DIMENSION', 'Key': 'SERVICE'}])
+
+        sliced = ResponseCache.slice(response, '2019-01-31', '2019-02-01')
+        self.assertEqual(['2019-01-31', '2019-02-01'], [day['TimePeriod']['Start'] for day in sliced['ResultsByTime']])
+
+        sliced['ResultsByTime'].clear()
+        self.assertEqual(4, len(response['ResultsByTime']))
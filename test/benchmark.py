@@ -0,0 +1,173 @@
+import os
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'package'))
+
+from chalicelib.costCube import CostCube  # noqa: E402
+from chalicelib.costRecord import decode_response  # noqa: E402
+from chalicelib.reportGenerator import ReportGenerator  # noqa: E402
+
+"""
+Benchmarks for the report pipeline. These are not unit tests; run them directly:
+
+    python test/benchmark.py
+"""
+
+
+def synthetic_response(days=31, owners=100, services=40, seed=0):
+    """
+    Build a Cost Explorer response grouped by owner and service with every owner using every service every day.
+
+    Like a real boto3 response, every key and amount is a separate string object.
+
+    :param int days: The number of days in the response. Starts on 2019-01-01.
+    :param int owners: The number of distinct Owner tags.
+    :param int services: The number of distinct services.
+    :param int seed: The seed for the random costs.
+    :return dict: A response in the format returned by the AWS Cost Explorer API.
+    """
+    rand = random.Random(seed)
+    results = []
+    for day in range(1, days + 1):
+        groups = [{'Keys': ['Owner$user%d@email.com' % o, 'Service %d' % s],
+                   'Metrics': {'BlendedCost': {'Amount': '%.10f' % rand.random(), 'Unit': 'USD'}}}
+                  for o in range(owners) for s in range(services)]
+        results.append({'TimePeriod': {'Start': '2019-01-%02d' % day, 'End': '2019-01-%02d' % (day + 1)},
+                        'Total': dict(), 'Groups': groups, 'Estimated': False})
+    return {'GroupDefinitions': [], 'ResultsByTime': results}
+
+
+def dict_tree(response, end_date):
+    """The processing approach replaced by costRecord: build the tree straight from the response."""
+    processed = defaultdict(lambda: defaultdict(dict))
+    for day_dict in response['ResultsByTime']:
+        date = day_dict['TimePeriod']['Start']
+        for s in day_dict['Groups']:
+            owner = s['Keys'][0].split('$')[1] or 'Untagged'
+            cost = float(s['Metrics']['BlendedCost']['Amount'])
+            if cost >= 0:
+                processed[owner][s['Keys'][1]][date] = cost
+    for owner in processed:
+        for service in processed[owner]:
+            processed[owner][service]['Total'] = sum(processed[owner][service].values())
+            processed[owner][service]['Increase'] = processed[owner][service].get(end_date, 0.0)
+    return processed
+
+
+def measure(function, setup=None):
+    """
+    Run function while tracing allocations.
+
+    The memory held by the value returned from setup is included, but setup's own peak is not. Pythons before 3.9
+    cannot reset the peak, so there it includes setup's peak as well.
+
+    :param function: The function to measure. Called with the value returned by setup, if given.
+    :param setup: A function returning the input to the measured function.
+    :return tuple: The elapsed seconds, the peak traced memory and the memory still held by the result, in bytes.
+    """
+    tracemalloc.start()
+    args = [setup()] if setup else []
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+
+    del args, result
+    tracemalloc.stop()
+    return elapsed, peak, retained
+
+
+def benchmark_processing():
+    """Compare peak memory of the dict-tree processing against decoding into CostRecords."""
+
+    def dict_tree_run(holder):
+        return dict_tree(holder.pop(), '2019-01-31')
+
+    def records_run(holder):
+        records = decode_response(holder.pop(), release=True)
+        return ReportGenerator.process_records_for_individual(records, '2019-01-31')
+
+    for name, function in [('dict tree', dict_tree_run), ('cost records', records_run)]:
+        elapsed, peak, retained = measure(function, lambda: [synthetic_response()])
+        print('{:20} {:8.2f}s {:10.1f} MiB peak {:10.1f} MiB retained'.format(name, elapsed, peak / 2 ** 20,
+                                                                             retained / 2 ** 20))
+
+
+def synthetic_accounts(accounts=100, owners=100, services=40, days=31, seed=0):
+    """
+    Build processed management data, in the format produced by ReportGenerator.process_records_for_managers.
+
+    :return dict: {account: {'Owner': processed, 'Service': processed}}
+    """
+    rand = random.Random(seed)
+    dates = ['2019-01-%02d' % day for day in range(1, days + 1)]
+
+    def processed(names):
+        data = {name: {date: rand.random() for date in dates} for name in names}
+        for costs in data.values():
+            costs['Total'] = sum(costs.values())
+            costs['Increase'] = costs[dates[-1]]
+        data['Total'] = sum(costs['Total'] for costs in data.values())
+        data['Increase'] = sum(costs['Increase'] for name, costs in data.items() if name != 'Total')
+        return data
+
+    return {str(acct): {'Owner': processed('user%d@email.com' % o for o in range(owners)),
+                        'Service': processed('Service %d' % s for s in range(services))}
+            for acct in range(accounts)}
+
+
+def benchmark_cube(workers=8):
+    """
+    Compare submitting each account's graphs with its dictionaries against submitting them from one CostCube.
+
+    Both follow the submit pattern of ReportGenerator.create_graphics_in_parallel, with one task per account. Pickled
+    dictionaries are sent with every task. With a cube, each worker is sent the handle once, when it starts, and each
+    task only names its account. Workers are simulated in this process.
+    """
+    response_by_account = synthetic_accounts()
+    accts = list(response_by_account)
+    args = ('2019-01-01', '2019-01-31', 0.01)
+
+    start = time.perf_counter()
+    sent = 0
+    for acct in accts:
+        payload = pickle.dumps((response_by_account[acct]['Owner'], response_by_account[acct]['Service'],
+                                'Account %s' % acct) + args)
+        sent += len(payload)
+        pickle.loads(payload)
+    pickled = time.perf_counter() - start
+    print('{:20} {:8.2f}s {:10.1f} MiB sent to workers'.format('pickled dicts', pickled, sent / 2 ** 20))
+
+    start = time.perf_counter()
+    cube = CostCube.publish(response_by_account, '2019-01-01', '2019-01-31')
+    sent = 0
+    attached = []
+    for _ in range(workers):
+        payload = pickle.dumps(cube.handle)
+        sent += len(payload)
+        attached.append(CostCube.attach(pickle.loads(payload)))
+    for i, acct in enumerate(accts):
+        payload = pickle.dumps((acct, 'Account %s' % acct) + args)
+        sent += len(payload)
+        acct, _, _, end_date, _ = pickle.loads(payload)
+        worker = attached[i % workers]
+        worker.account_data(acct, 'Owner', end_date), worker.account_data(acct, 'Service', end_date)
+    for worker in attached:
+        worker.close()
+    shared = time.perf_counter() - start
+    print('{:20} {:8.2f}s {:10.1f} MiB sent to workers, {:.1f} MiB shared'.format(
+        'cost cube', shared, sent / 2 ** 20, os.path.getsize(cube.handle.path) / 2 ** 20))
+    cube.close()
+
+
+if __name__ == '__main__':
+    benchmark_processing()
+    benchmark_cube()
@@ -0,0 +1,44 @@
+import unittest
+from clients import ClientRegistry
+
+"""
+The test suite for clients.
+"""
+
+
+class ClientRegistryTest(unittest.TestCase):
+
+    def testClientsAreShared(self):
+        """Ensure that asking for the same client twice returns the same, tuned, client."""
+        registry = ClientRegistry(max_pool_connections=25)
+
+        client = registry('ce', region_name='us-east-1')
+
+        self.assertIs(client, registry(service_name='ce', region_name='us-east-1'))
+        self.assertIsNot(client, registry('ce', region_name='us-west-2'))
+        self.assertEqual(25, client.meta.config.max_pool_connections)
+        self.assertEqual('adaptive', client.meta.config.retries['mode'])
+
+    def testConfigure(self):
+        """Ensure that clients are only discarded when the settings change."""
+        registry = ClientRegistry()
+        client = registry('ce', region_name='us-east-1')
+
+        registry.configure(**ClientRegistry.defaults)
+        self.assertIs(client, registry('ce', region_name='us-east-1'))
+
+        registry.configure(read_timeout=5)
+        self.assertIsNot(client, registry('ce', region_name='us-east-1'))
+
+        with self.assertRaises(ValueError):
+            registry.configure(pool_size=5)
+
+    def testConfigureRestoresDefaults(self):
+        """Ensure that a setting left out of a later configuration goes back to its default."""
+        registry = ClientRegistry()
+
+        registry.configure(max_pool_connections=5)
+        self.assertEqual(5, registry.settings['max_pool_connections'])
+
+        registry.configure()
+        self.assertEqual(ClientRegistry.defaults, registry.settings)
@@ -0,0 +1,28 @@
+import pickle
+import unittest
+from costCube import CostCube
+
+"""
+The test suite for costCube.
+"""
+
+
+class CostCubeTest(unittest.TestCase):
+
+    def testRoundTrip(self):
+        """Ensure that a worker attaching to a published cube sees the same costs, and that the handle stays small."""
+        response_by_account = {'1234': {'Owner': {'user1': {'2019-01-01': 1.5, '2019-01-03': 0.0,
+                                                            'Total': 1.5, 'Increase': 0.0},
+                                                  'Total': 1.5, 'Increase': 0.0},
+                                        'Service': {'EC2': {'2019-01-02': 2.0, 'Total': 2.0, 'Increase': 0.0},
+                                                    'Total': 2.0, 'Increase': 0.0}}}
+
+        cube = CostCube.publish(response_by_account, '2019-01-01', '2019-01-03')
+        try:
+            attached = CostCube.attach(pickle.loads(pickle.dumps(cube.handle)))
+
+            self.assertEqual(response_by_account['1234']['Owner'], attached.account_data('1234', 'Owner'))
+            self.assertEqual(response_by_account['1234']['Service'], attached.account_data('1234', 'Service'))
+            attached.close()
+        finally:
+            cube.close()
@@ -0,0 +1,62 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from costExporter import CostExporter
+
+"""
+The test suite for costExporter.
+"""
+
+
+class CostExporterTest(unittest.TestCase):
+
+    nums_to_aliases = {'1234': 'Account 1', 'Total': 'Total'}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testExport(self):
+        """Ensure that every day of every series is exported once, in both formats, leaving out totals."""
+        management = {'1234': {'Owner': {'user1': {'2019-01-01': 1.5, 'Total': 1.5, 'Increase': 1.5},
+                                         'Total': 1.5, 'Increase': 1.5},
+                               'Service': {'EC2': {'2019-01-01': 1.5, 'Total': 1.5, 'Increase': 1.5},
+                                           'Total': 1.5, 'Increase': 1.5}}}
+        individual = {'1234': {'user1': {'EC2': {'2019-01-01': 1.5, 'Total': 1.5, 'Increase': 1.5},
+                                         'Total': 1.5, 'Increase': 1.5},
+                               'Total': 1.5, 'Increase': 1.5}}
+
+        exporter = CostExporter(self.directory)
+        exporter.export_management(management, self.nums_to_aliases, '2019-01-01', '2019-01-01')
+        exporter.export_management(management, self.nums_to_aliases, '2019-01-01', '2019-01-01')  # Another manager
+        exporter.export_individual(individual, self.nums_to_aliases, '2019-01-01', '2019-01-01')
+        jsonl, csv_path = exporter.close()
+
+        expected = [['1234', 'Account 1', 'owner', 'user1', '', '2019-01-01', 1.5],
+                    ['1234', 'Account 1', 'service', '', 'EC2', '2019-01-01', 1.5],
+                    ['1234', 'Account 1', 'owner_service', 'user1', 'EC2', '2019-01-01', 1.5]]
+
+        with gzip.open(jsonl, 'rt') as f:
+            self.assertEqual(expected, [[row[column] for column in CostExporter.columns] for row in map(json.loads, f)])
+
+        with gzip.open(csv_path, 'rt', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(list(CostExporter.columns), rows[0])
+        self.assertEqual([row[:-1] + [str(row[-1])] for row in expected], rows[1:])
+
+    def testAbort(self):
+        """Ensure that an aborted export leaves no files behind, and that aborting after closing changes nothing."""
+        exporter = CostExporter(self.directory)
+        exporter.abort()
+        self.assertEqual([], os.listdir(self.directory))
+
+        exporter = CostExporter(self.directory)
+        paths = exporter.close()
+        exporter.abort()
+        self.assertEqual(sorted(os.path.basename(path) for path in paths), sorted(os.listdir(self.directory)))
@@ -0,0 +1,77 @@
+import unittest
+from costRecord import CostRecord, decode_response
+from ownerNormalizer import OwnerNormalizer
+from reportGenerator import ReportGenerator
+
+"""
+The test suite for costRecord.
+"""
+
+
+class CostRecordTest(unittest.TestCase):
+
+    def testDecodeResponse(self):
+        """Ensure that owners are normalized, services are kept and negative costs are dropped."""
+        response = {'ResultsByTime': [
+                        {'TimePeriod': {'Start': '2019-01-01', 'End': '2019-01-02'},
+                         'Groups': [
+                             {'Keys': ['Owner$user1', 'service1'],
+                              'Metrics': {'BlendedCost': {'Amount': '0.5', 'Unit': 'USD'}}},
+                             {'Keys': ['Owner$', 'service1'],
+                              'Metrics': {'BlendedCost': {'Amount': '1.5', 'Unit': 'USD'}}},
+                             {'Keys': ['Owner$i-0123abcd', 'service2'],
+                              'Metrics': {'BlendedCost': {'Amount': '2', 'Unit': 'USD'}}},
+                             {'Keys': ['Owner$', ''],
+                              'Metrics': {'BlendedCost': {'Amount': '-1000', 'Unit': 'USD'}}}
+                         ]}]}
+
+        expected = [CostRecord('2019-01-01', 'user1', 'service1', 0.5),
+                    CostRecord('2019-01-01', 'Untagged', 'service1', 1.5),
+                    CostRecord('2019-01-01', 'i-*', 'service2', 2.0)]
+
+        self.assertEqual(expected, decode_response(response))
+
+    def testDecodeSingleCategory(self):
+        """Ensure that a response grouped only by service is keyed by service."""
+        response = {'ResultsByTime': [
+                        {'TimePeriod': {'Start': '2019-01-01', 'End': '2019-01-02'},
+                         'Groups': [
+                             {'Keys': ['service1'],
+                              'Metrics': {'BlendedCost': {'Amount': '0.25', 'Unit': 'USD'}}}
+                         ]}]}
+
+        record = decode_response(response)[0]
+
+        self.assertIsNone(record.owner)
+        self.assertEqual('service1', record.key)
+
+    def testEmptyServiceIsUntagged(self):
+        """Ensure that an empty service is reported as 'Untagged' when grouped with owners, as it is on its own."""
+        response = {'ResultsByTime': [
+                        {'TimePeriod': {'Start': '2019-01-01', 'End': '2019-01-02'},
+                         'Groups': [
+                             {'Keys': ['Owner$user1', ''],
+                              'Metrics': {'BlendedCost': {'Amount': '0.5', 'Unit': 'USD'}}}
+                         ]}]}
+
+        processed = ReportGenerator.process_api_response_for_individual(response, '2019-01-01')
+
+        self.assertEqual({'Untagged', 'Total', 'Increase'}, set(processed['user1']))
+
+    def testDuplicateDatesAreSummed(self):
+        """Ensure that the costs of all owners normalized to one name are added up, not only those of instances."""
+        groups = [{'Keys': ['Owner$%s' % owner, 'service1'],
+                   'Metrics': {'BlendedCost': {'Amount': amount, 'Unit': 'USD'}}}
+                  for owner, amount in [('user1', '1'), ('User1', '2'), ('i-0123', '3'), ('i-4567', '4')]]
+        response = {'ResultsByTime': [{'TimePeriod': {'Start': '2019-01-01', 'End': '2019-01-02'}, 'Groups': groups}]}
+        normalizer = OwnerNormalizer({'case_fold': True})
+
+        individual = ReportGenerator.process_api_response_for_individual(response, '2019-01-01', normalizer)
+        self.assertEqual(3.0, individual['user1']['service1']['2019-01-01'])
+        self.assertEqual(7.0, individual['i-*']['service1']['2019-01-01'])
+
+        managers = ReportGenerator.process_api_response_for_managers(
+            {'ResultsByTime': [{'TimePeriod': {'Start': '2019-01-01', 'End': '2019-01-02'},
+                                'Groups': [dict(g, Keys=g['Keys'][:1]) for g in groups]}]}, '2019-01-01', normalizer)
+        self.assertEqual(3.0, managers['user1']['2019-01-01'])
+        self.assertEqual(7.0, managers['i-*']['2019-01-01'])
@@ -0,0 +1,44 @@
+import unittest
+from graphGenerator import GraphGenerator
+
+"""
+The test suite for GraphGenerator.
+"""
+
+
+class GraphGeneratorTest(unittest.TestCase):
+
+    def testListDataAcrossMonths(self):
+        """Ensure that a period crossing the end of a month has a value for every day of it."""
+        data = {'user1': {'2019-01-31': 1.0, '2019-02-01': 2.0, '2019-02-02': 3.0}}
+
+        self.assertEqual(([1, 2, 3, 4], [0, 1.0, 2.0, 3.0]),
+                         GraphGenerator.list_data(data, 'user1', '2019-01-30', '2019-02-02'))
+        self.assertEqual(([1, 2, 3, 4], [0, 1.0, 3.0, 6.0]),
+                         GraphGenerator.list_data(data, 'user1', '2019-01-30', '2019-02-02', total=True))
+
+    def testGraphBarAcrossMonths(self):
+        """Ensure that a bar graph crossing the end of a month draws a bar for every day, labelled by date."""
+        data = {'user1': {'2019-01-31': 1.0, '2019-02-01': 2.0, 'Total': 3.0}, 'Total': 3.0}
+
+        graph, legend = GraphGenerator.graph_bar(data, 'title', '2019-01-30', '2019-02-02', dark=False)
+        axes = graph.gca()
+        graph.gcf().canvas.draw()
+
+        self.assertEqual([0, 1.0, 2.0, 0], [bar.get_height() for bar in axes.patches])
+        labels = {tick.get_text() for tick in axes.get_xticklabels()}
+        self.assertTrue({'30', '31', '1', '2'} <= labels)
+        graph.close()
+
+    def testGraphPanels(self):
+        """Ensure that each panel gets its own axes, and every name appears once in a legend shared between them."""
+        panels = [('Account %d' % a, {'user%d' % u: {'2019-01-01': 1.0, 'Total': 1.0} for u in range(a, a + 2)})
+                  for a in range(3)]
+
+        graph, legend = GraphGenerator.graph_panels(panels, 'title', '2019-01-01', '2019-01-02', dark=False)
+        axes = graph.gcf().axes
+
+        self.assertEqual(4, len(axes))  # two rows of two, with the last space hidden
+        self.assertEqual(['Account 0', 'Account 1', 'Account 2'], [a.get_title() for a in axes if a.get_visible()])
+        self.assertEqual(['user0', 'user1', 'user2', 'user3'], [text.get_text() for text in legend.get_texts()])
+        graph.close()
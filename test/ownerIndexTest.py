@@ -0,0 +1,26 @@
+import unittest
+from costRecord import CostRecord
+from ownerIndex import OwnerIndex
+
+"""
+The test suite for ownerIndex.
+"""
+
+
+class OwnerIndexTest(unittest.TestCase):
+
+    def testLookup(self):
+        """Ensure that an owner's records are found by account, and that only the accounts they used are listed."""
+        index = OwnerIndex()
+        index.add('1111', [CostRecord('2019-01-01', 'user1', 'EC2', 1.0),
+                           CostRecord('2019-01-01', 'user2', 'S3', 2.0)])
+        index.add('2222', [CostRecord('2019-01-01', 'user2', 'EC2', 3.0),
+                           CostRecord('2019-01-02', 'user2', 'EC2', 4.0)])
+
+        self.assertEqual(['1111'], index.accounts('user1'))
+        self.assertEqual(['1111', '2222'], index.accounts('user2'))
+        self.assertEqual([], index.accounts('user3'))
+
+        self.assertEqual([CostRecord('2019-01-01', 'user2', 'EC2', 3.0), CostRecord('2019-01-02', 'user2', 'EC2', 4.0)],
+                         index.records('user2', '2222'))
+        self.assertEqual([], index.records('user1', '2222'))
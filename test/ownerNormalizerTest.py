@@ -0,0 +1,45 @@
+import unittest
+from ownerNormalizer import OwnerNormalizer
+
+"""
+The test suite for ownerNormalizer.
+"""
+
+
+class OwnerNormalizerTest(unittest.TestCase):
+
+    def testDefaultRules(self):
+        """Ensure that only empty tags and instance ids are renamed by default."""
+        normalizer = OwnerNormalizer()
+
+        self.assertEqual('Untagged', normalizer.canonical(''))
+        self.assertEqual('i-*', normalizer.canonical('i-0123abcd'))
+        self.assertEqual('User1@email.com', normalizer.canonical('User1@email.com'))
+
+    def testRules(self):
+        """Ensure that the rules are applied in order and that canonical names are memoized."""
+        normalizer = OwnerNormalizer({'case_fold': True,
+                                      'strip': [':.*$'],
+                                      'aliases': {'Old@email.com': 'new@email.com'},
+                                      'patterns': [['^ci-', 'ci-bots']],
+                                      'teams': {'new@email.com': 'platform'}})
+
+        self.assertEqual('platform', normalizer.canonical('OLD@email.com:session-1234'))
+        self.assertEqual('ci-bots', normalizer.canonical('CI-runner-7'))
+        self.assertEqual('Untagged', normalizer.canonical(':session-only'))
+
+        normalizer.canonical('OLD@email.com:session-1234')
+        self.assertEqual(1, normalizer.canonical.cache_info().hits)
+
+    def testTeamsOnlyGroupIdentities(self):
+        """Ensure that teams group owners without changing who each owner is."""
+        normalizer = OwnerNormalizer({'case_fold': True, 'teams': {'dev1@email.com': 'platform'}})
+
+        self.assertEqual('platform', normalizer.canonical('Dev1@email.com'))
+        self.assertEqual('dev1@email.com', normalizer.identity('Dev1@email.com'))
+        self.assertEqual('dev1@email.com', normalizer.without_teams().canonical('Dev1@email.com'))
+
+    def testUnknownRule(self):
+        """Ensure that a misspelled rule is reported instead of ignored."""
+        with self.assertRaises(ValueError):
+            OwnerNormalizer({'alias': {}})
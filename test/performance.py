@@ -0,0 +1,309 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'package')
+sys.path.insert(0, PACKAGE)
+
+from chalicelib import awsAuditor  # noqa: E402
+from chalicelib.replay import Outbox  # noqa: E402
+
+"""
+A performance harness for the whole report pipeline. These are not unit tests; performanceTest runs them against
+the baseline stored on this machine when AWSAUDITOR_PERF is set. To measure a workload, or to store a baseline, run:
+
+    python test/performance.py [workload ...]
+    python test/performance.py --update
+
+Each workload sends every report in a fixed synthetic config through awsAuditor.main, with a fake AWS that
+generates costs on demand and an Outbox in place of the mail server. For every stage of the run it records the wall
+time, the peak RSS of the process when the stage finished, and the AWS calls made, by operation.
+"""
+
+# Timings only mean something on the machine they were taken on, so the baseline is kept out of version control and
+# records the host it was stored on.
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'performanceBaseline.json')
+
+WORKLOADS = {
+    # A manager of every account and one user, with a graph per account.
+    'separate': {'accounts': 3, 'owners': 24, 'services': 8, 'managers': 1, 'users': 1,
+                 'periods': [('2019-01-01', '2019-01-31')], 'config': {'chart_layout': 'separate'}},
+    # Managers of overlapping accounts and several users, with one image of every graph in each report.
+    'grid': {'accounts': 3, 'owners': 16, 'services': 6, 'managers': 2, 'users': 2,
+             'periods': [('2019-01-01', '2019-01-31')], 'config': {'chart_layout': 'grid'}},
+    # A backfill of three months, exported as well as emailed.
+    'backfill': {'accounts': 1, 'owners': 30, 'services': 8, 'managers': 1, 'users': 1,
+                 'periods': [('2019-01-01', '2019-01-31'), ('2019-02-01', '2019-02-28'), ('2019-03-01', '2019-03-31')],
+                 'config': {'chart_layout': 'separate', 'export': True}},
+}
+
+# Rendering takes most of the time, so the workloads make few images from a lot of data.
+
+
+def peak_rss_kib():
+    """
+    :return int: The largest the resident set of this process has been since reset_peak_rss, in KiB.
+    """
+    # ru_maxrss survives exec, so a workload started from a large process would report that process's peak instead.
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    """
+    Lower the peak RSS of this process to its current RSS, so peak_rss_kib measures from now on.
+
+    :return bool: False if the peak could not be reset, eg: on a kernel older than 4.0 or outside Linux. The peak is
+                  then that of the whole process so far.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StageRecorder:
+    """
+    Record the wall time and peak RSS of each stage, with the interface of chalicelib.profiler.Profiler.
+
+    The peak RSS of a stage is the largest the process was during any call of it: the kernel's high-water mark is
+    reset as each call starts. Where it cannot be reset, it is the largest the process had been when the stage
+    finished, and stages after the largest all report the same peak.
+
+    Stages do not nest: a stage entered while another one is running is counted as part of the outer stage.
+    """
+
+    def __init__(self):
+        self.active = None
+        self.stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'peak_rss_kib': 0, 'api_calls': dict()})
+        self.peak_rss_kib = 0  # The peak of the whole run, which resetting for each stage would otherwise lose.
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.active:
+            yield
+            return
+
+        self.active = name
+        self.peak_rss_kib = max(self.peak_rss_kib, peak_rss_kib())
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages[name]
+            stage['calls'] += 1
+            stage['seconds'] += time.perf_counter() - start
+            peak = peak_rss_kib()
+            stage['peak_rss_kib'] = max(stage['peak_rss_kib'], peak)
+            self.peak_rss_kib = max(self.peak_rss_kib, peak)
+            self.active = None
+
+    def count_call(self, operation):
+        """Count an AWS call against the running stage, or against 'setup' if no stage is running."""
+        calls = self.stages[self.active or 'setup']['api_calls']
+        calls[operation] = calls.get(operation, 0) + 1
+
+    def save(self):
+        pass
+
+
+class FakeAWS:
+    """
+    Stands in for boto3.client, generating the same costs for the same query every time.
+
+    Owner o uses account a unless (o + a) is a multiple of 3, and uses service s when (o + s) is even. Every cost
+    depends only on the account, owner, service and day, so any grouping, filter or period of the same organization
+    adds up consistently.
+    """
+
+    def __init__(self, recorder, accounts, owners, services):
+        self.recorder = recorder
+        self.accounts = ['%012d' % (a + 1) for a in range(accounts)]
+        self.owners = ['user%d@email.com' % o for o in range(owners)]
+        self.services = ['Service %d' % s for s in range(services)]
+        self.account_numbers = {acct: a for a, acct in enumerate(self.accounts)}
+        self.owner_numbers = {owner: o for o, owner in enumerate(self.owners)}
+
+    def __call__(self, service_name, **kwargs):
+        return self
+
+    def __getattr__(self, operation):
+        respond = getattr(self, '_' + operation)
+
+        def call(**params):
+            self.recorder.count_call(operation)
+            return respond(**params)
+        return call
+
+    def _list_accounts(self, **params):
+        return {'Accounts': [{'Id': acct, 'Name': 'Account %d' % a} for a, acct in enumerate(self.accounts)]}
+
+    def _get_secret_value(self, **params):
+        return {'SecretString': json.dumps({'sender@email.com': 'password'})}
+
+    def _get_cost_and_usage(self, TimePeriod, Filter, GroupBy, **params):
+        filters = Filter.get('And', [Filter])
+        accounts = [f['Dimensions']['Values'] for f in filters if 'Dimensions' in f][0]
+        tags = [f['Tags']['Values'] for f in filters if 'Tags' in f]
+        owners = tags[0] if tags else self.owners
+        keys = [group['Key'] for group in GroupBy]
+
+        results = []
+        day = datetime.datetime.strptime(TimePeriod['Start'], '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(TimePeriod['End'], '%Y-%m-%d').date()
+        while day < end:
+            costs = dict()
+            for acct in accounts:
+                a = self.account_numbers[acct]
+                for owner in owners:
+                    o = self.owner_numbers[owner]
+                    if (o + a) % 3 == 0:
+                        continue
+                    for s, service in enumerate(self.services):
+                        if (o + s) % 2 == 0:
+                            group = tuple('Owner$' + owner if key == 'Owner' else service for key in keys)
+                            costs[group] = costs.get(group, 0.0) + ((a * 7 + o * 5 + s * 3 + day.day) % 23) / 10
+
+            results.append({'TimePeriod': {'Start': str(day), 'End': str(day + datetime.timedelta(days=1))},
+                            'Groups': [{'Keys': list(group), 'Metrics': {'BlendedCost': {'Amount': '%.10f' % cost,
+                                                                                          'Unit': 'USD'}}}
+                                       for group, cost in costs.items()]})
+            day += datetime.timedelta(days=1)
+
+        return {'ResultsByTime': results}
+
+
+def run_workload(name):
+    """
+    Send every report of a workload, recording each stage.
+
+    Must be run from the package directory, which is where the lambda runs from.
+
+    :param str name: One of the keys of WORKLOADS.
+    :return dict: Each stage mapped to its calls, seconds, peak_rss_kib and api_calls by operation.
+    """
+    workload = WORKLOADS[name]
+    recorder = StageRecorder()
+    aws = FakeAWS(recorder, workload['accounts'], workload['owners'], workload['services'])
+
+    accounts = ['Account %d' % a for a in range(workload['accounts'])]
+    # Manager m is sent the report for every account but the first m. Users are every 3rd owner.
+    config = dict({'managers': {'manager%d@email.com' % m: accounts[m:] for m in range(workload['managers'])},
+                   'users': aws.owners[1::3][:workload['users']], 'secret_name': 'secret'}, **workload['config'])
+
+    if config.get('export'):
+        config['export'] = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    try:
+        awsAuditor.main(client_factory=aws, smtp_factory=Outbox().smtp_factory, config=config,
+                        periods=workload['periods'], profiler=recorder)
+    finally:
+        if config.get('export'):
+            shutil.rmtree(config['export'])
+
+    stages = dict(recorder.stages)
+    stages['total'] = {'calls': 1, 'seconds': time.perf_counter() - start,
+                       'peak_rss_kib': max(recorder.peak_rss_kib, peak_rss_kib()),
+                       'api_calls': {operation: sum(stage['api_calls'].get(operation, 0) for stage in stages.values())
+                                     for operation in ['get_cost_and_usage', 'list_accounts', 'get_secret_value']}}
+    return stages
+
+
+def measure(name):
+    """
+    Run a workload in a fresh interpreter, so its memory use does not depend on what ran before it.
+
+    :param str name: One of the keys of WORKLOADS.
+    :return dict: The stages recorded by run_workload.
+    """
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--json', name], cwd=PACKAGE, check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def compare(baseline, current, threshold=0.5, slack_seconds=0.25):
+    """
+    Find the stages of a workload that regressed.
+
+    A stage regresses when it makes more AWS calls than the baseline, or when its wall time or peak RSS grows by more
+    than threshold times the baseline. Wall time is also given slack_seconds of leeway, so stages that take a few
+    milliseconds are not failed by noise.
+
+    :param dict baseline: The stages of the workload in the baseline.
+    :param dict current: The stages of the same workload as measured now.
+    :param float threshold: The allowed growth, eg: 0.5 allows a stage to take 50% longer.
+    :param float slack_seconds: The wall time any stage may grow by regardless of threshold.
+    :return list(str): A description of each regression.
+    """
+    regressions = []
+    for name, before in sorted(baseline.items()):
+        after = current.get(name)
+        if after is None:
+            continue  # A stage that no longer runs is not a regression.
+
+        for operation, count in sorted(after['api_calls'].items()):
+            if count > before['api_calls'].get(operation, 0):
+                regressions.append('{}: {} {} calls, was {}'.format(name, count, operation,
+                                                                    before['api_calls'].get(operation, 0)))
+
+        if after['seconds'] > before['seconds'] * (1 + threshold) + slack_seconds:
+            regressions.append('{}: {:.3f}s, was {:.3f}s'.format(name, after['seconds'], before['seconds']))
+
+        if after['peak_rss_kib'] > before['peak_rss_kib'] * (1 + threshold):
+            regressions.append('{}: peak RSS {} KiB, was {} KiB'.format(name, after['peak_rss_kib'],
+                                                                         before['peak_rss_kib']))
+    return regressions
+
+
+def load_baseline():
+    """
+    :return dict: The stages of each workload in the stored baseline, or an empty dict if there is no baseline or it
+                  was stored on another machine.
+    """
+    if not os.path.exists(BASELINE):
+        return dict()
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    return baseline['workloads'] if baseline.get('host') == platform.node() else dict()
+
+
+def report(name, stages):
+    print('\n{}'.format(name))
+    print('{:40} {:>6} {:>10} {:>14} {:>10}'.format('stage', 'calls', 'seconds', 'peak RSS KiB', 'AWS calls'))
+    for stage, results in sorted(stages.items(), key=lambda item: item[1]['seconds'], reverse=True):
+        print('{:40} {:6d} {:10.3f} {:14d} {:10d}'.format(stage, results['calls'], results['seconds'],
+                                                          results['peak_rss_kib'], sum(results['api_calls'].values())))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    if args[:1] == ['--json']:
+        print(json.dumps(run_workload(args[1])))
+    elif args[:1] == ['--update']:
+        baseline = {name: measure(name) for name in sorted(WORKLOADS)}
+        with open(BASELINE, 'w') as f:
+            json.dump({'host': platform.node(), 'workloads': baseline}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        for name, stages in baseline.items():
+            report(name, stages)
+    else:
+        for name in args or sorted(WORKLOADS):
+            report(name, measure(name))
@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import performance  # noqa: E402
+
+"""
+The performance regression gate. Runs each workload in performance.WORKLOADS and compares every stage to the
+baseline stored on this machine.
+
+The workloads take a while and their timings depend on the machine, so they only run when AWSAUDITOR_PERF is set,
+and are skipped until a baseline has been stored on the same host with:
+
+    python test/performance.py --update
+
+AWSAUDITOR_PERF_THRESHOLD sets how much a stage's wall time or peak RSS may grow before failing, eg: 0.5 for 50%.
+AWS calls may never grow.
+"""
+
+
+@unittest.skipUnless(os.environ.get('AWSAUDITOR_PERF'), 'Set AWSAUDITOR_PERF to run the performance workloads.')
+class PerformanceTest(unittest.TestCase):
+
+    threshold = float(os.environ.get('AWSAUDITOR_PERF_THRESHOLD', 0.5))
+
+    @classmethod
+    def setUpClass(cls):
+        cls.baseline = performance.load_baseline()
+
+    def assertNoRegressions(self, workload):
+        if workload not in self.baseline:
+            self.skipTest('No baseline for the {} workload on this machine. Run: python test/performance.py --update'
+                          .format(workload))
+
+        regressions = performance.compare(self.baseline[workload], performance.measure(workload), self.threshold)
+        self.assertEqual([], regressions, 'The {} workload regressed'.format(workload))
+
+    def testSeparate(self):
+        """Ensure that reports with a graph per account have not become slower, larger or chattier."""
+        self.assertNoRegressions('separate')
+
+    def testGrid(self):
+        """Ensure that reports with one image of every graph have not become slower, larger or chattier."""
+        self.assertNoRegressions('grid')
+
+    def testBackfill(self):
+        """Ensure that backfilling and exporting several months has not become slower, larger or chattier."""
+        self.assertNoRegressions('backfill')
+
+
+class CompareTest(unittest.TestCase):
+
+    def testCompare(self):
+        """Ensure that more AWS calls always fail, and that time and memory fail only beyond the threshold."""
+        baseline = {'api_call': {'calls': 2, 'seconds': 1.0, 'peak_rss_kib': 1000,
+                                 'api_calls': {'get_cost_and_usage': 2}}}
+
+        within = {'api_call': {'calls': 2, 'seconds': 1.4, 'peak_rss_kib': 1400,
+                               'api_calls': {'get_cost_and_usage': 2}}}
+        self.assertEqual([], performance.compare(baseline, within, threshold=0.5, slack_seconds=0))
+
+        beyond = {'api_call': {'calls': 2, 'seconds': 1.6, 'peak_rss_kib': 1600,
+                               'api_calls': {'get_cost_and_usage': 3}}}
+        self.assertEqual(3, len(performance.compare(baseline, beyond, threshold=0.5, slack_seconds=0)))
+
+
+class StageRecorderTest(unittest.TestCase):
+
+    def testPeakPerStage(self):
+        """Ensure that a stage after a larger one reports its own peak RSS, not the larger one's."""
+        if not performance.reset_peak_rss():
+            self.skipTest('The peak RSS of this process cannot be reset.')
+
+        recorder = performance.StageRecorder()
+        with recorder.stage('large'):
+            block = bytearray(64 * 2 ** 20)
+            block[::4096] = b'1' * len(block[::4096])  # Touch every page so it is resident.
+            del block
+        with recorder.stage('small'):
+            pass
+
+        self.assertGreater(recorder.stages['large']['peak_rss_kib'] - recorder.stages['small']['peak_rss_kib'],
+                           32 * 2 ** 10)
+        self.assertEqual(recorder.stages['large']['peak_rss_kib'], recorder.peak_rss_kib)
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+from profiler import Profiler
+
+"""
+The test suite for profiler.
+"""
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testStagesAreSaved(self):
+        """Ensure that each stage is written out and that repeated calls accumulate into one stage."""
+        profiler = Profiler(self.directory)
+
+        for i in range(3):
+            with profiler.stage('api_call'):
+                [str(n) for n in range(1000)]
+        with profiler.stage('send_email'):
+            with profiler.stage('graph_bar'):  # Nested stages count towards the outer stage.
+                pass
+        profiler.save()
+
+        self.assertEqual({'api_call': 3, 'send_email': 1}, profiler.calls)
+        self.assertEqual({'stages.txt', 'api_call.prof', 'api_call.alloc.txt', 'send_email.prof',
+                          'send_email.alloc.txt'}, set(os.listdir(self.directory)))
+
+    def testPeakOfStage(self):
+        """Ensure that a stage's peak and allocation sites count what it allocated, not what earlier stages hold."""
+        profiler = Profiler(self.directory)
+
+        with profiler.stage('load'):
+            held = bytearray(2 ** 20)
+        with profiler.stage('process'):
+            bytearray(2 ** 18)
+            kept = bytearray(2 ** 16)
+        profiler.save()
+
+        self.assertGreaterEqual(profiler.peaks['load'], 2 ** 20)
+        self.assertGreaterEqual(profiler.peaks['process'], 2 ** 18)
+        self.assertLess(profiler.peaks['process'], 2 ** 20)
+        self.assertGreaterEqual(sum(profiler.allocations['process'].values()), 2 ** 16)
+        self.assertLess(sum(profiler.allocations['process'].values()), 2 ** 18)
+        del held, kept
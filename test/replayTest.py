@@ -0,0 +1,106 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from replay import Recorder, Replayer
+
+"""
+The test suite for replay.
+"""
+
+
+class FakeAWS:
+    """Stands in for boto3.client, answering every call the pipeline makes with a fixed response."""
+
+    config = {'managers': {'manager@email.com': ['Account 1']}, 'users': ['user1'], 'secret_name': 'secret'}
+
+    def __init__(self, service_name, **kwargs):
+        self.service_name = service_name
+
+    def get_object(self, **params):
+        return {'Body': io.BytesIO(json.dumps(self.config).encode('utf-8'))}
+
+    def list_accounts(self, **params):
+        return {'Accounts': [{'Id': '1234', 'Name': 'Account 1'}]}
+
+    def get_secret_value(self, **params):
+        return {'SecretString': json.dumps({'sender@email.com': 'password'})}
+
+    def get_cost_and_usage(self, **params):
+        keys = [group['Key'] for group in params['GroupBy']]
+        keys = ['Owner$user1' if key == 'Owner' else 'service1' for key in keys]
+        return {'ResultsByTime': [{'TimePeriod': {'Start': '2019-01-01', 'End': '2019-01-02'},
+                                   'Groups': [{'Keys': keys,
+                                               'Metrics': {'BlendedCost': {'Amount': '1.5', 'Unit': 'USD'}}}]}]}
+
+
+class FakeSMTP:
+
+    def __init__(self, host, port):
+        self.sent = []
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.sent.append(to_addrs)
+
+    def quit(self):
+        pass
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRoundTrip(self):
+        """Ensure that a recorded run of awsAuditor.main replays offline, delivering the same mail."""
+        from chalicelib import awsAuditor
+
+        bundle = os.path.join(self.directory, 'bundle.json.gz')
+        outbox = os.path.join(self.directory, 'outbox')
+
+        recorder = Recorder(client_factory=FakeAWS, smtp_factory=FakeSMTP)
+        awsAuditor.main('2019-01-01', '2019-01-01', client_factory=recorder.client_factory,
+                        smtp_factory=recorder.smtp_factory)
+        recorder.save(bundle, start='2019-01-01', end='2019-01-01')
+
+        replayer = Replayer(bundle, outbox)
+        awsAuditor.main('2019-01-01', '2019-01-01', client_factory=replayer.client_factory,
+                        smtp_factory=replayer.smtp_factory)
+
+        self.assertEqual([m['to'] for m in recorder.mail], [to for _, to, _ in replayer.delivered])
+        self.assertEqual(len(recorder.mail), len(os.listdir(outbox)))
+
+    def testSecretsRedacted(self):
+        """Ensure that the email password is used while recording but never written to the bundle."""
+        recorder = Recorder(client_factory=FakeAWS, smtp_factory=FakeSMTP)
+        client = recorder.client_factory('secretsmanager', region_name='us-west-2')
+
+        secret = client.get_secret_value(SecretId='secret')
+        self.assertEqual({'sender@email.com': 'password'}, json.loads(secret['SecretString']))
+
+        bundle = os.path.join(self.directory, 'bundle.json.gz')
+        recorder.save(bundle)
+        with gzip.open(bundle, 'rt') as f:
+            self.assertNotIn('password', f.read())
+
+        replayed = Replayer(bundle).client_factory('secretsmanager').get_secret_value(SecretId='secret')
+        self.assertEqual({'sender@email.com': 'redacted'}, json.loads(replayed['SecretString']))
+
+    def testUnrecordedRequest(self):
+        """Ensure that a request missing from the bundle is reported rather than answered with the wrong data."""
+        client = Replayer({'calls': []}).client_factory('ce')
+
+        with self.assertRaises(KeyError):
+            client.get_cost_and_usage(Granularity='DAILY')
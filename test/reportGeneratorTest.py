@@ -1,5 +1,8 @@
+import contextlib
+import os
 import unittest
 from reportGenerator import ReportGenerator
+from replay import Replayer
 
 """
 The test suite for ReportGenerator.
@@ -13,7 +16,9 @@ class ReportGeneratorTest(unittest.TestCase):
         cls.start_date = '2019-01-01'
         cls.end_date = '2019-01-25'
         cls.username = 'fake_user'
-        cls.rg = ReportGenerator(cls.start_date, cls.end_date)
+        cls.organization = {'calls': [{'service': 'organizations', 'operation': 'list_accounts', 'params': {},
+                                       'response': {'Accounts': []}}]}
+        cls.rg = ReportGenerator(cls.start_date, cls.end_date, client_factory=Replayer(cls.organization).client_factory)
         cls.rg.nums_to_aliases = {'1234': 'Account 1', '5678': 'Account 2'}
 
         cls.sample_response = {'GroupDefinitions': None, 'ResponseMetadata': None,
@@ -146,3 +151,103 @@ class ReportGeneratorTest(unittest.TestCase):
         invalid_date = '2019-01-33'
         with self.assertRaises(ValueError):
             ReportGenerator.increment_date(invalid_date)
+
+    def testSendEmailOnce(self):
+        """Ensure that a report is serialized once and sent to every recipient in a single transaction."""
+        bundle = {'calls': [{'service': 'organizations', 'operation': 'list_accounts', 'params': {},
+                             'response': {'Accounts': []}},
+                            {'service': 'secretsmanager', 'operation': 'get_secret_value',
+                             'params': {'SecretId': 'secret'},
+                             'response': {'SecretString': '{"sender@email.com": "password"}'}}]}
+        replayer = Replayer(bundle)
+        rg = ReportGenerator(self.start_date, self.end_date, secret_name='secret',
+                             client_factory=replayer.client_factory, smtp_factory=replayer.smtp_factory)
+
+        rg.send_email(['manager1@email.com', 'manager2@email.com'], 'report')
+
+        self.assertEqual(1, len(replayer.delivered))
+        sender, recipients, message = replayer.delivered[0]
+        self.assertEqual(['manager1@email.com', 'manager2@email.com'], recipients)
+        self.assertIn(b'To: undisclosed-recipients:;\n', message)
+        self.assertNotIn(b'manager1@email.com', message)
+        self.assertIs(rg.build_message('report'), rg.build_message('report'))
+
+        rg.send_email('manager1@email.com', 'report')
+        self.assertIn(b'To: manager1@email.com\n', replayer.delivered[1][2])
+
+    def testCreateManagementReportBodySparkline(self):
+        """Ensure that an account too cheap to graph gets a sparkline of its daily costs instead."""
+        acct_expenditures = {
+                        '1234': {'Owner': {
+                                    'user1': {'2019-01-01': 0.20, '2019-01-03': 0.40, 'Total': 0.60, 'Increase': 0.0},
+                                    'Total': 0.60, 'Increase': 0.0}}
+                     }
+        rg = ReportGenerator('2019-01-01', '2019-01-03', client_factory=Replayer(self.organization).client_factory)
+        rg.nums_to_aliases = self.rg.nums_to_aliases
+
+        report = rg.create_management_report_body(acct_expenditures)
+
+        self.assertFalse(rg.should_graph(acct_expenditures['1234']['Owner']))
+        self.assertIn('\t\tAccount 1\n\t\t\t\u2585\u2581\u2588\n', report)
+
+    def testCreateManagementPanelGraphics(self):
+        """Ensure that the panels of a management report are split across images of at most panel_rows rows."""
+        rg = ReportGenerator('2019-01-01', '2019-01-02', client_factory=Replayer(self.organization).client_factory)
+        rg.nums_to_aliases = {str(a): 'Account %d' % a for a in range(3)}
+        rg.panel_rows = 2
+        costs = {'user1': {'2019-01-01': 2.0, 'Total': 2.0, 'Increase': 0.0}, 'Total': 2.0, 'Increase': 0.0}
+        response_by_account = {str(a): {'Owner': costs, 'Service': costs} for a in range(3)}
+
+        pngs = rg.create_management_panel_graphics(response_by_account)
+
+        # 6 panels, by owner and by service for each account, in images of 2 rows of 2.
+        self.assertEqual(['/tmp/Account-0-Account-1-Account-2_overview-1.png',
+                          '/tmp/Account-0-Account-1-Account-2_overview-2.png'], pngs)
+        self.assertTrue(all(os.path.exists(png) for png in pngs))
+        self.assertEqual([], rg.create_management_panel_graphics({'0': {'Owner': {'Total': 0.0, 'Increase': 0.0},
+                                                                        'Service': {'Total': 0.0, 'Increase': 0.0}}}))
+
+    def testCreateIndividualPanelGraphics(self):
+        """Ensure that a user's accounts are graphed in a single image, leaving out accounts they did not use."""
+        rg = ReportGenerator('2019-01-01', '2019-01-02', client_factory=Replayer(self.organization).client_factory)
+        rg.nums_to_aliases = self.rg.nums_to_aliases
+        response_by_account = {'1234': {'user1': {'service1': {'2019-01-01': 2.0, 'Total': 2.0}, 'Total': 2.0}},
+                               '5678': {'user2': {'service1': {'2019-01-01': 2.0, 'Total': 2.0}, 'Total': 2.0}}}
+
+        self.assertEqual(['/tmp/user1_All-Accounts.png'],
+                         rg.create_individual_panel_graphics(response_by_account, 'user1'))
+        self.assertEqual([], rg.create_individual_panel_graphics(response_by_account, 'user3'))
+
+    def testCreateGraphicsInParallel(self):
+        """Ensure that graphs drawn by render workers are the same as those drawn one at a time, and errors surface."""
+        rg = ReportGenerator('2019-01-01', '2019-01-03', client_factory=Replayer(self.organization).client_factory,
+                             render_workers=2)
+        rg.nums_to_aliases = {'1': 'Parallel 1', '2': 'Parallel 2'}
+        response_by_account = dict()
+        for a in ['1', '2']:
+            costs = {'user%s' % a: {'2019-01-01': 2.0, '2019-01-03': 1.0, 'Total': 3.0, 'Increase': 1.0},
+                     'user3': {'2019-01-02': 0.5, 'Total': 0.5, 'Increase': 0.0}, 'Total': 3.5, 'Increase': 1.0}
+            response_by_account[a] = {'Owner': costs, 'Service': costs}
+        pngs = ['/tmp/Parallel-%s_by_%s.png' % (a, category) for a in ['1', '2'] for category in ['owner', 'service']]
+
+        def drawn():
+            images = []
+            for png in pngs:
+                with open(png, 'rb') as f:
+                    images.append(f.read())
+                os.remove(png)
+            return images
+
+        stages = []
+        rg.profiler.stage = lambda name: (stages.append(name), contextlib.suppress())[1]
+
+        rg.create_graphics_in_parallel(response_by_account, ['1', '2'])
+        parallel = drawn()
+        self.assertEqual(['publish_cost_cube', 'render_workers'], stages)  # Not the fallback for Lambda.
+        for acct in ['1', '2']:
+            rg.create_account_graphics(response_by_account, acct)
+        self.assertEqual(drawn(), parallel)
+
+        rg.min_series_total = None  # Can't be compared with a total, so every worker fails.
+        with self.assertRaises(TypeError):
+            rg.create_graphics_in_parallel(response_by_account, ['1', '2'])
@@ -0,0 +1,86 @@
+import io
+import json
+import unittest
+
+from botocore.exceptions import ClientError
+
+import awsAuditor
+from runtime import RuntimeContext
+
+"""
+The test suite for runtime.
+"""
+
+
+class FakeAWS:
+    """Stands in for boto3.client, counting the calls made to each service. S3 honours IfNoneMatch."""
+
+    config = {'managers': {}, 'users': [], 'secret_name': 'secret'}
+    etag = '"1"'
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, service_name, **kwargs):
+        return self
+
+    def get_object(self, **params):
+        self.calls.append('get_object')
+        if params.get('IfNoneMatch') == self.etag:
+            raise ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+        return {'Body': io.BytesIO(json.dumps(self.config).encode('utf-8')), 'ETag': self.etag}
+
+    def list_accounts(self, **params):
+        self.calls.append('list_accounts')
+        return {'Accounts': [{'Id': '1234', 'Name': 'Account 1'}]}
+
+    def get_secret_value(self, **params):
+        self.calls.append('get_secret_value')
+        return {'SecretString': json.dumps({'sender@email.com': 'password'})}
+
+
+class RuntimeContextTest(unittest.TestCase):
+
+    def testConfigRevalidated(self):
+        """Ensure that the config is only parsed again when its ETag changes."""
+        aws = FakeAWS()
+        context = RuntimeContext(aws)
+
+        config = context.config('bucket', 'config.json')
+        self.assertIs(config, context.config('bucket', 'config.json'))
+
+        aws.config = dict(aws.config, users=['user1'])
+        aws.etag = '"2"'
+        self.assertEqual(['user1'], context.config('bucket', 'config.json')['users'])
+        self.assertEqual(['get_object'] * 3, aws.calls)
+
+    def testWarmRunSkipsSetup(self):
+        """Ensure that a second run with the same context only checks the config, until the context is invalidated."""
+        aws = FakeAWS()
+        context = RuntimeContext(aws)
+
+        awsAuditor.main('2019-01-01', '2019-01-02', context=context)
+        self.assertEqual(['get_object', 'list_accounts', 'get_secret_value'], aws.calls)
+
+        aws.calls = []
+        awsAuditor.main('2019-01-01', '2019-01-02', context=context)
+        self.assertEqual(['get_object'], aws.calls)
+
+        aws.calls = []
+        context.invalidate('credentials')
+        awsAuditor.main('2019-01-01', '2019-01-02', context=context)
+        self.assertEqual(['get_object', 'get_secret_value'], aws.calls)
+
+        aws.calls = []
+        context.invalidate()
+        awsAuditor.main('2019-01-01', '2019-01-02', context=context)
+        self.assertEqual(['get_object', 'list_accounts', 'get_secret_value'], aws.calls)
+
+    def testInvalidateUnknownKind(self):
+        """Ensure that invalidating a kind that is not cached raises an error, and forgets nothing."""
+        context = RuntimeContext(FakeAWS())
+        context.cached(('accounts',), dict)
+
+        with self.assertRaises(ValueError):
+            context.invalidate('accounts', 'a')
+        self.assertIn(('accounts',), context.values)
@@ -0,0 +1,45 @@
+import unittest
+from spendAnalyzer import build_matrix, dates_between, top_movers
+
+"""
+The test suite for spendAnalyzer.
+"""
+
+
+class SpendAnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = dates_between('2019-01-01', '2019-01-10')
+
+    def testTopMovers(self):
+        """Ensure that spikes are ranked by how unusual they are and that small changes are left out."""
+        steady = {date: 10.0 for date in self.dates}
+        noisy = {date: 10.0 + (i % 2) * 20 for i, date in enumerate(self.dates)}
+        spike = dict(steady, **{'2019-01-10': 15.0})
+        drop = dict(steady, **{'2019-01-10': 0.0})
+        small = dict(steady, **{'2019-01-10': 10.5})
+
+        series = [(('Account 1', 'steady'), steady), (('Account 1', 'noisy'), noisy), (('Account 1', 'spike'), spike),
+                  (('Account 2', 'drop'), drop), (('Account 2', 'small'), small)]
+
+        movers = top_movers(series, '2019-01-01', '2019-01-10', n=3)
+
+        self.assertEqual([('Account 2', 'drop'), ('Account 1', 'spike'), ('Account 1', 'noisy')],
+                         [mover.label for mover in movers])
+        self.assertEqual(-10.0, movers[0].change)
+        self.assertEqual(10.0, movers[0].baseline)
+
+    def testBuildMatrix(self):
+        """Ensure that each series becomes a row, with missing days as 0 and keys other than dates left out."""
+        series = [('user1', {'2019-01-02': 2.0, 'Total': 2.0, 'Increase': 2.0}),
+                  ('user2', {'2019-01-01': 1.0, '2019-01-03': 3.0, '2018-12-31': 9.0})]
+
+        labels, matrix = build_matrix(series, ['2019-01-01', '2019-01-02', '2019-01-03'])
+
+        self.assertEqual(['user1', 'user2'], labels)
+        self.assertEqual([[0.0, 2.0, 0.0], [1.0, 0.0, 3.0]], matrix.tolist())
+        self.assertEqual((0, 3), build_matrix([], ['2019-01-01', '2019-01-02', '2019-01-03'])[1].shape)
+
+    def testSingleDay(self):
+        """Ensure that there are no movers without a day to compare against."""
+        self.assertEqual([], top_movers([(('Account 1', 'user1'), {'2019-01-01': 5.0})], '2019-01-01', '2019-01-01'))